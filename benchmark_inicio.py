@@ -0,0 +1,130 @@
+"""
+Benchmark del inicio en frío de la API (escalado desde cero)
+Inicia la API varias veces como proceso nuevo contra la API simulada (mock_upstream.py) y mide:
+importación de la aplicación, tiempo hasta aceptar conexiones (/health), tiempo hasta estar lista (/listo),
+latencia de la primera solicitud de negocio y de la siguiente, y tiempo de apagado tras SIGTERM.
+
+Uso:
+    python benchmark_inicio.py --repeticiones 5
+    python benchmark_inicio.py --repeticiones 5 --umbral-listo 3
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import requests
+
+from prueba_resistencia import construir_solicitud
+
+DIRECTORIO_APP = os.path.dirname(os.path.abspath(__file__))
+
+
+def esperar(url: str, timeout: float, estado: int = 200) -> Optional[float]:
+    """
+    Consulta la URL hasta obtener el código esperado; retorna el instante (monotonic) en que lo obtuvo
+    """
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            if requests.get(url, timeout=1).status_code == estado:
+                return time.monotonic()
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def medir_importacion(entorno: Dict[str, str]) -> float:
+    inicio = time.monotonic()
+    subprocess.run([sys.executable, "-c", "import main"], cwd=DIRECTORIO_APP, env=entorno, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.monotonic() - inicio
+
+
+def medir_inicio(entorno: Dict[str, str], puerto: int, timeout: float) -> Dict[str, float]:
+    url = f"http://127.0.0.1:{puerto}"
+    inicio = time.monotonic()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(puerto), "--log-level", "warning"],
+        cwd=DIRECTORIO_APP, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    medicion: Dict[str, float] = {}
+    try:
+        aceptando = esperar(f"{url}/health", timeout)
+        listo = esperar(f"{url}/listo", timeout)
+        if aceptando is None or listo is None:
+            raise RuntimeError("La API no quedó lista dentro del timeout")
+        medicion["aceptando_conexiones"] = aceptando - inicio
+        medicion["listo"] = listo - inicio
+
+        for etiqueta, numero in (("primera_solicitud", 1), ("segunda_solicitud", 2)):
+            antes = time.monotonic()
+            requests.post(f"{url}/consultar-estado", json=construir_solicitud("consultar", numero), timeout=60)
+            medicion[etiqueta] = time.monotonic() - antes
+    finally:
+        antes = time.monotonic()
+        proceso.send_signal(signal.SIGTERM)
+        proceso.wait(timeout=60)
+        medicion["apagado"] = time.monotonic() - antes
+    return medicion
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark del inicio en frío de la API")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--latencia-ms", type=float, default=50, help="Latencia media de la API simulada")
+    parser.add_argument("--puerto-app", type=int, default=8081)
+    parser.add_argument("--puerto-mock", type=int, default=8091)
+    parser.add_argument("--timeout", type=float, default=60, help="Espera máxima hasta que la API esté lista")
+    parser.add_argument("--umbral-listo", type=float, default=None,
+                        help="Termina con código 1 si la mediana hasta estar lista supera estos segundos")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="inicio-")
+    entorno = dict(
+        os.environ,
+        API_BASE_URL=f"http://127.0.0.1:{args.puerto_mock}",
+        REGISTRO_SINIESTROS_DB=os.path.join(directorio, "registro.db"),
+        DRENADO_PENDIENTES_ARCHIVO=os.path.join(directorio, "pendientes.ndjson"),
+    )
+    entorno.pop("CAPTURA_TRAFICO_ARCHIVO", None)
+
+    mock = subprocess.Popen(
+        [sys.executable, os.path.join(DIRECTORIO_APP, "mock_upstream.py"),
+         "--puerto", str(args.puerto_mock), "--latencia-ms", str(args.latencia_ms)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    resultados: Dict[str, List[float]] = defaultdict(list)
+    try:
+        if esperar(f"http://127.0.0.1:{args.puerto_mock}/docs", args.timeout) is None:
+            print("La API simulada no inició")
+            return 1
+        for repeticion in range(args.repeticiones):
+            resultados["importacion"].append(medir_importacion(entorno))
+            for etiqueta, segundos in medir_inicio(entorno, args.puerto_app, args.timeout).items():
+                resultados[etiqueta].append(segundos)
+            print(f"Repetición {repeticion + 1}: listo en {resultados['listo'][-1]:.2f}s")
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    print(f"\n{'medición':22s} {'mediana':>9s} {'mínimo':>9s} {'máximo':>9s}")
+    for etiqueta in ("importacion", "aceptando_conexiones", "listo", "primera_solicitud", "segunda_solicitud", "apagado"):
+        valores = resultados[etiqueta]
+        print(f"{etiqueta:22s} {statistics.median(valores):8.3f}s {min(valores):8.3f}s {max(valores):8.3f}s")
+
+    if args.umbral_listo is not None and statistics.median(resultados["listo"]) > args.umbral_listo:
+        print(f"FALLO: la mediana hasta estar lista supera {args.umbral_listo:.1f}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+from registro_siniestros import buscar_campo
+
+logger = logging.getLogger(__name__)
+
+# Endpoints de negocio cuya forma se captura
+ENDPOINTS_CAPTURADOS = (
+    "/crear-siniestro",
+    "/consultar-estado",
+    "/pago-siniestro",
+    "/modificacion-reserva",
+    "/reserva-pago",
+    "/crear-siniestros-masivo",
+)
+
+# Cuerpos más grandes solo se miden (bytes y líneas), sin analizar su contenido
+MAX_BYTES_ANALIZADOS = 1024 * 1024
+
+# Llamadas a la API de Seguros Bolívar hechas durante la solicitud capturada: [operacion, segundos, estado]
+_llamadas_upstream: ContextVar[Optional[List[list]]] = ContextVar("llamadas_upstream", default=None)
+
+
+def operacion_upstream(url: str) -> str:
+    """
+    Nombre corto de la operación de la API de Seguros Bolívar según la URL (token, procesar, estado)
+    """
+    return urlparse(url).path.rstrip("/").rsplit("/", 1)[-1] or "raiz"
+
+
+def registrar_llamada_upstream(url: str, segundos: float, estado: Any):
+    """
+    Registra la duración de una llamada a la API si la solicitud actual está siendo capturada
+    """
+    llamadas = _llamadas_upstream.get()
+    if llamadas is not None:
+        llamadas.append([operacion_upstream(url), round(segundos, 4), estado])
+
+
+def forma_solicitud(cuerpo: bytes) -> Dict[str, Any]:
+    """
+    Forma anonimizada del cuerpo: tamaño, líneas y largo de las listas de datos, sin ningún valor
+    """
+    forma: Dict[str, Any] = {"bytes": len(cuerpo), "lineas": cuerpo.count(b"\n")}
+    if not cuerpo or len(cuerpo) > MAX_BYTES_ANALIZADOS:
+        return forma
+    try:
+        datos = json.loads(cuerpo)
+    except ValueError:
+        return forma
+    for campo in ("vdatos_variables", "vdatos_reserva"):
+        lista = buscar_campo(datos, campo)
+        if isinstance(lista, list):
+            forma[campo] = len(lista)
+    return forma
+
+
+class CapturaTrafico:
+    """
+    Captura opcional del tráfico real para reproducirlo en pruebas de rendimiento
+    Escribe una línea NDJSON por solicitud con el endpoint, la forma del cuerpo, el código de respuesta,
+    la duración y las llamadas a la API de Seguros Bolívar con su latencia. No guarda valores de los campos.
+    Se activa con CAPTURA_TRAFICO_ARCHIVO.
+    """
+
+    def __init__(self, ruta: Optional[str] = None):
+        self.ruta = ruta or os.getenv("CAPTURA_TRAFICO_ARCHIVO")
+        self.muestreo = float(os.getenv("CAPTURA_TRAFICO_MUESTREO", "1"))
+        self.inicio = time.monotonic()
+        self.capturadas = 0
+        self._archivo = None
+        if self.ruta:
+            self._archivo = open(self.ruta, "a", encoding="utf-8")
+            logger.info(f"Captura de tráfico activa en {self.ruta} (muestreo {self.muestreo:.0%})")
+
+    @property
+    def habilitada(self) -> bool:
+        return self._archivo is not None
+
+    def debe_capturar(self, path: str) -> bool:
+        return self.habilitada and path in ENDPOINTS_CAPTURADOS and random.random() < self.muestreo
+
+    def escribir(self, registro: Dict[str, Any]):
+        self._archivo.write(json.dumps(registro, separators=(",", ":")) + "\n")
+        self.capturadas += 1
+        if self.capturadas % 100 == 0:
+            self._archivo.flush()
+
+    def cerrar(self):
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+
+    def metricas(self) -> Dict[str, Any]:
+        return {"habilitada": self.habilitada, "capturadas": self.capturadas}
+
+
+class CapturaTraficoMiddleware:
+    """
+    Middleware ASGI que mide el cuerpo, el código de respuesta, la duración y las llamadas
+    a la API de cada solicitud capturada. Sin captura activa solo agrega una comparación.
+    """
+
+    def __init__(self, app, captura: CapturaTrafico):
+        self.app = app
+        self.captura = captura
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.captura.debe_capturar(scope.get("path")):
+            await self.app(scope, receive, send)
+            return
+
+        fragmentos: List[bytes] = []
+        tamano = 0
+        lineas = 0
+        estado = {"codigo": 0}
+
+        async def receive_medido():
+            nonlocal tamano, lineas
+            mensaje = await receive()
+            if mensaje["type"] == "http.request":
+                cuerpo = mensaje.get("body", b"")
+                tamano += len(cuerpo)
+                lineas += cuerpo.count(b"\n")
+                if tamano <= MAX_BYTES_ANALIZADOS:
+                    fragmentos.append(cuerpo)
+            return mensaje
+
+        async def send_medido(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado["codigo"] = mensaje["status"]
+            await send(mensaje)
+
+        llamadas: List[list] = []
+        token = _llamadas_upstream.set(llamadas)
+        inicio = time.monotonic()
+        try:
+            await self.app(scope, receive_medido, send_medido)
+        finally:
+            duracion = time.monotonic() - inicio
+            _llamadas_upstream.reset(token)
+            forma = forma_solicitud(b"".join(fragmentos)) if tamano <= MAX_BYTES_ANALIZADOS else {}
+            forma.update({"bytes": tamano, "lineas": lineas})
+            self.captura.escribir({
+                "t": round(inicio - self.captura.inicio, 3),
+                "endpoint": scope["path"],
+                **forma,
+                "estado": estado["codigo"] or 499,
+                "duracion": round(duracion, 4),
+                "upstream": llamadas
+            })
@@ -0,0 +1,238 @@
+import asyncio
+import codecs
+import csv
+import json
+import logging
+import os
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Set, Tuple
+
+from pydantic import ValidationError
+
+from cuotas_canal import identificar_canal
+from drenado import drenado
+
+logger = logging.getLogger(__name__)
+
+FORMATOS_SOPORTADOS = ("csv", "ndjson")
+
+
+class CargaMasivaService:
+    def __init__(self, siniestro_service, modelo_siniestro, registro_siniestros=None, despachador=None):
+        self.siniestro_service = siniestro_service
+        self.modelo_siniestro = modelo_siniestro
+        self.registro_siniestros = registro_siniestros
+        self.despachador = despachador
+        self.max_concurrencia = max(1, int(os.getenv("CARGA_MASIVA_CONCURRENCIA", "5")))
+        # Codificación de respaldo para líneas que no son UTF-8 (exportaciones de hojas de cálculo en Windows)
+        self.codificacion_alterna = os.getenv("CARGA_MASIVA_CODIFICACION_ALTERNA", "cp1252")
+
+    def detectar_formato(self, nombre_archivo: Optional[str], content_type: Optional[str],
+                         formato: Optional[str] = None) -> str:
+        """
+        Determina el formato del archivo (csv o ndjson) a partir del parámetro explícito,
+        la extensión del archivo o el content-type
+        """
+        if formato:
+            formato = formato.lower()
+            if formato not in FORMATOS_SOPORTADOS:
+                raise ValueError(f"Formato no soportado: {formato}")
+            return formato
+
+        nombre = (nombre_archivo or "").lower()
+        tipo = (content_type or "").lower()
+
+        if nombre.endswith(".csv") or "csv" in tipo:
+            return "csv"
+        if nombre.endswith((".ndjson", ".jsonl")) or "ndjson" in tipo or "jsonl" in tipo:
+            return "ndjson"
+
+        raise ValueError(f"No se pudo determinar el formato del archivo: {nombre_archivo}")
+
+    def decodificar_lineas(self, archivo, codificacion: Optional[str], invalidas: Set[int]) -> Iterator[str]:
+        """
+        Decodifica el archivo línea por línea: con la codificación indicada o, si no se indica, en UTF-8 con
+        respaldo en CARGA_MASIVA_CODIFICACION_ALTERNA. Las líneas que no se pueden decodificar se agregan
+        a invalidas y se entregan con caracteres de reemplazo, para reportar su fila sin cortar la carga
+        """
+        codificaciones = (codificacion,) if codificacion else ("utf-8", self.codificacion_alterna)
+        for numero, linea in enumerate(archivo, start=1):
+            if numero == 1 and linea.startswith(codecs.BOM_UTF8):
+                linea = linea[len(codecs.BOM_UTF8):]
+            texto = None
+            for nombre in codificaciones:
+                try:
+                    texto = linea.decode(nombre)
+                    break
+                except UnicodeDecodeError:
+                    continue
+            if texto is None:
+                invalidas.add(numero)
+                texto = linea.decode(codificaciones[0], errors="replace")
+            yield texto
+
+    def leer_filas(self, archivo, formato: str,
+                   codificacion: Optional[str] = None) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+        """
+        Lee el archivo fila por fila sin cargarlo completo en memoria
+        Retorna tuplas (numero_fila, datos, error) donde datos es un diccionario crudo; una fila mal formada
+        o con bytes no válidos se reporta como error y la lectura continúa con la siguiente
+        """
+        invalidas: Set[int] = set()
+        lineas = self.decodificar_lineas(archivo, codificacion, invalidas)
+        error_codificacion = f"La fila contiene bytes que no son válidos en {codificacion or 'UTF-8 ni ' + self.codificacion_alterna}"
+
+        if formato == "csv":
+            lector = csv.DictReader(lineas)
+            numero = 0
+            while True:
+                try:
+                    fila = next(lector)
+                except StopIteration:
+                    break
+                except csv.Error as e:
+                    numero += 1
+                    invalidas.difference_update([n for n in invalidas if n <= lector.line_num])
+                    yield numero, None, f"Fila CSV mal formada: {str(e)}"
+                    continue
+                numero += 1
+
+                # Una fila puede ocupar varias líneas (campos entre comillas): se revisan todas las que consumió
+                consumidas = [n for n in invalidas if n <= lector.line_num]
+                if consumidas:
+                    invalidas.difference_update(consumidas)
+                    yield numero, None, error_codificacion
+                    continue
+                if None in fila:
+                    yield numero, None, f"La fila tiene {len(fila[None])} columnas más que el encabezado"
+                    continue
+
+                # En CSV las variables dinámicas llegan como un arreglo JSON en una sola columna
+                variables = (fila.get("vdatos_variables") or "").strip()
+                try:
+                    fila["vdatos_variables"] = json.loads(variables) if variables else []
+                except ValueError as e:
+                    yield numero, None, f"vdatos_variables no es un JSON válido: {str(e)}"
+                    continue
+                yield numero, fila, None
+        else:
+            numero = 0
+            for numero_linea, linea in enumerate(lineas, start=1):
+                linea = linea.strip()
+                if not linea:
+                    continue
+                numero += 1
+                if numero_linea in invalidas:
+                    invalidas.discard(numero_linea)
+                    yield numero, None, error_codificacion
+                    continue
+                try:
+                    fila = json.loads(linea)
+                except ValueError as e:
+                    yield numero, None, f"Línea no es un JSON válido: {str(e)}"
+                    continue
+                if not isinstance(fila, dict):
+                    yield numero, None, "Cada línea debe ser un objeto JSON"
+                    continue
+                yield numero, fila, None
+
+    async def procesar_fila(self, numero: int, fila: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Valida una fila como SiniestroRequest y la envía al servicio de creación
+        """
+        try:
+            request = self.modelo_siniestro(**fila)
+        except ValidationError as e:
+            logger.warning(f"Fila {numero} inválida en carga masiva: {str(e)}")
+            return {"fila": numero, "success": False, "error": e.errors(include_url=False, include_input=False)}
+        except TypeError as e:
+            logger.warning(f"Fila {numero} inválida en carga masiva: {str(e)}")
+            return {"fila": numero, "success": False, "error": str(e)}
+
+        try:
+            datos = request.dict()
+            if self.despachador is not None:
+                # Las filas esperan su turno en la cola justa del canal en lugar de ser rechazadas
+                canal = identificar_canal(
+                    {}, request.entidad_colocadora, request.sim_sistema_origen, request.sim_usuario_creacion
+                )
+                async with self.despachador.turno(canal, bloquear=True):
+                    resultado = await self.siniestro_service.procesar_siniestro(datos)
+            else:
+                resultado = await self.siniestro_service.procesar_siniestro(datos)
+        except Exception as e:
+            logger.error(f"Error creando siniestro de la fila {numero}: {str(e)}")
+            return {
+                "fila": numero,
+                "success": False,
+                "transaccion": request.transaccion,
+                "error": str(e)
+            }
+
+        if self.registro_siniestros is not None:
+            await self.registro_siniestros.registrar_async("creacion", datos, resultado)
+        return {"fila": numero, "success": True, "data": resultado}
+
+    async def procesar_archivo(self, archivo, formato: str, codificacion: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Método principal de la carga masiva
+        Procesa las filas con concurrencia acotada y emite cada resultado como una línea NDJSON
+        en cuanto termina, de modo que la memoria no depende del tamaño del archivo
+        """
+        pendientes = set()
+        total = 0
+        exitosos = 0
+
+        def serializar(resultado: Dict[str, Any]) -> str:
+            return json.dumps(resultado, ensure_ascii=False, default=str) + "\n"
+
+        async def recolectar(esperar_todos: bool) -> AsyncIterator[str]:
+            nonlocal pendientes, exitosos
+            terminados, pendientes = await asyncio.wait(
+                pendientes,
+                return_when=asyncio.ALL_COMPLETED if esperar_todos else asyncio.FIRST_COMPLETED
+            )
+            for tarea in terminados:
+                resultado = tarea.result()
+                if resultado["success"]:
+                    exitosos += 1
+                yield serializar(resultado)
+
+        logger.info(f"Iniciando carga masiva de siniestros en formato {formato}")
+
+        interrumpida_en = None
+
+        try:
+            for numero, fila, error in self.leer_filas(archivo, formato, codificacion):
+                # Si la instancia se está apagando no se inician filas nuevas; el cliente reenvía desde esta fila
+                if drenado.activo:
+                    interrumpida_en = numero
+                    break
+                total = numero
+                if error:
+                    yield serializar({"fila": numero, "success": False, "error": error})
+                    continue
+
+                if len(pendientes) >= self.max_concurrencia:
+                    async for linea in recolectar(esperar_todos=False):
+                        yield linea
+                pendientes.add(asyncio.create_task(self.procesar_fila(numero, fila)))
+
+            if pendientes:
+                async for linea in recolectar(esperar_todos=True):
+                    yield linea
+
+            logger.info(f"Carga masiva completada: {exitosos} de {total} filas exitosas")
+
+            resumen = {
+                "total": total,
+                "exitosos": exitosos,
+                "fallidos": total - exitosos
+            }
+            if interrumpida_en is not None:
+                logger.warning(f"Carga masiva interrumpida por apagado de la instancia en la fila {interrumpida_en}")
+                resumen["interrumpida_en_fila"] = interrumpida_en
+            yield serializar({"resumen": resumen})
+        finally:
+            # Si el cliente se desconecta se cancelan las filas que aún están en curso
+            for tarea in pendientes:
+                tarea.cancel()
@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, Optional
+
+logger = logging.getLogger(__name__)
+
+# Categorías de códigos simples soportadas por el catálogo
+CATEGORIAS = (
+    "causas_siniestro",
+    "coberturas",
+    "conceptos_reserva",
+    "conceptos_liquidacion",
+    "tipos_expediente",
+)
+
+
+class CatalogoReferencia:
+    """
+    Catálogo local de códigos de referencia indexado en memoria
+    Permite rechazar códigos inválidos sin consultar la API de Seguros Bolívar.
+    Las categorías que no estén definidas en el archivo no se validan.
+    """
+
+    def __init__(self, ruta: Optional[str] = None):
+        self.ruta = ruta or os.getenv("CATALOGO_REFERENCIA_PATH", "catalogo_referencia.json")
+        self.intervalo_recarga = float(os.getenv("CATALOGO_RECARGA_SEGUNDOS", "60"))
+        self._indices: Dict[str, Any] = {}
+        self._mtime: Optional[float] = None
+        self._cargado_en: Optional[str] = None
+        self._ultima_verificacion = time.monotonic()
+        self.recargar()
+
+    def _construir_indices(self, datos: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Construye los índices normalizando todos los códigos a string
+        """
+        indices: Dict[str, Any] = {}
+
+        for categoria in CATEGORIAS:
+            if datos.get(categoria) is not None:
+                indices[categoria] = frozenset(str(codigo) for codigo in datos[categoria])
+
+        # Productos válidos por sección: {"cod_secc": ["cod_producto", ...]}
+        if datos.get("productos") is not None:
+            indices["productos"] = {
+                str(seccion): frozenset(str(producto) for producto in productos)
+                for seccion, productos in datos["productos"].items()
+            }
+
+        return indices
+
+    def recargar(self) -> bool:
+        """
+        Carga (o recarga) el catálogo desde el archivo
+        Si el archivo no existe el catálogo queda deshabilitado; si es inválido se conservan los índices actuales
+        """
+        try:
+            mtime = os.stat(self.ruta).st_mtime
+        except FileNotFoundError:
+            if self._indices:
+                logger.warning(f"Archivo de catálogo no encontrado, se conserva el catálogo actual: {self.ruta}")
+            else:
+                logger.info(f"Catálogo de referencia no configurado, validación local deshabilitada: {self.ruta}")
+            return False
+
+        try:
+            with open(self.ruta, encoding="utf-8") as archivo:
+                indices = self._construir_indices(json.load(archivo))
+        except Exception as e:
+            logger.error(f"Error cargando catálogo de referencia {self.ruta}: {str(e)}")
+            return False
+
+        # Reemplazo atómico: las validaciones en curso siguen usando los índices anteriores
+        self._indices = indices
+        self._mtime = mtime
+        self._cargado_en = datetime.now().isoformat()
+        logger.info(f"Catálogo de referencia cargado desde {self.ruta}: {self.resumen()['categorias']}")
+        return True
+
+    def _verificar_recarga(self):
+        """
+        Recarga el catálogo si el archivo cambió, revisando como máximo una vez por intervalo
+        """
+        ahora = time.monotonic()
+        if ahora - self._ultima_verificacion < self.intervalo_recarga:
+            return
+        self._ultima_verificacion = ahora
+
+        try:
+            mtime = os.stat(self.ruta).st_mtime
+        except OSError:
+            return
+
+        if mtime != self._mtime:
+            logger.info("Cambio detectado en el catálogo de referencia, recargando...")
+            self.recargar()
+
+    def validar(self, categoria: str, campo: str, valor: Any):
+        """
+        Valida que el código exista en la categoría indicada
+        Lanza ValueError si el código no existe (pydantic lo convierte en un error 422)
+        """
+        self._verificar_recarga()
+        codigos: Optional[FrozenSet[str]] = self._indices.get(categoria)
+        if codigos is not None and str(valor) not in codigos:
+            raise ValueError(f"{campo} '{valor}' no existe en el catálogo de referencia")
+        return valor
+
+    def validar_producto(self, cod_secc: Any, cod_producto: Any):
+        """
+        Valida que la combinación sección/producto exista en el catálogo
+        """
+        self._verificar_recarga()
+        productos: Optional[Dict[str, FrozenSet[str]]] = self._indices.get("productos")
+        if productos is None:
+            return
+        if str(cod_producto) not in productos.get(str(cod_secc), ()):
+            raise ValueError(
+                f"La combinación cod_secc '{cod_secc}' / cod_producto '{cod_producto}' "
+                f"no existe en el catálogo de referencia"
+            )
+
+    def resumen(self) -> Dict[str, Any]:
+        """
+        Retorna el estado del catálogo: ruta, fecha de carga y cantidad de códigos por categoría
+        """
+        indices = self._indices
+        categorias = {categoria: len(codigos) for categoria, codigos in indices.items() if categoria != "productos"}
+        if "productos" in indices:
+            categorias["productos"] = sum(len(productos) for productos in indices["productos"].values())
+
+        return {
+            "habilitado": bool(indices),
+            "ruta": self.ruta,
+            "cargado_en": self._cargado_en,
+            "categorias": categorias
+        }
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import plazo_solicitud
+from captura_trafico import operacion_upstream, registrar_llamada_upstream
+from limite_adaptativo import ESTADOS_SOBRECARGA, crear_limites
+
+logger = logging.getLogger(__name__)
+
+# Operaciones de la API con límite adaptativo de llamadas en curso (el token y el calentamiento no se limitan)
+OPERACIONES_LIMITADAS = ("procesar", "estado")
+
+
+class ClienteUpstream:
+    """
+    Cliente HTTP compartido por todos los servicios para llamar a la API de Seguros Bolívar
+    Reutiliza un pool de conexiones, ejecuta las llamadas bloqueantes fuera del event loop
+    y ajusta cada timeout al tiempo restante del plazo de la solicitud
+    Las llamadas a procesar y estado pasan por un límite adaptativo de llamadas en curso (limite_adaptativo.py)
+    """
+
+    def __init__(self):
+        self.pool_size = int(os.getenv("UPSTREAM_POOL_SIZE", "20"))
+        self.session = requests.Session()
+
+        adaptador = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size)
+        self.session.mount("https://", adaptador)
+        self.session.mount("http://", adaptador)
+
+        # La sesión se comparte entre solicitudes de distintos clientes: no se conservan cookies
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        # Hilos propios del tamaño del pool: el executor por defecto solo tiene cpu + 4 hilos
+        # y las solicitudes de respaldo (hedging) ocupan hilos adicionales
+        self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="upstream")
+        self.limites = crear_limites(OPERACIONES_LIMITADAS, self.pool_size)
+
+    async def solicitar(self, metodo: str, url: str, timeout: float, **kwargs) -> requests.Response:
+        timeout_efectivo = plazo_solicitud.timeout(timeout)
+        # Un timeout recortado por el plazo de la solicitud no indica sobrecarga de la API
+        recortado = timeout_efectivo < timeout
+        limite = self.limites.get(operacion_upstream(url))
+        if limite is not None:
+            # La espera por un cupo descuenta del timeout de la llamada
+            inicio_espera = time.monotonic()
+            await limite.adquirir(timeout_efectivo)
+            timeout_efectivo -= time.monotonic() - inicio_espera
+            if timeout_efectivo <= 0:
+                limite.liberar()
+                raise requests.exceptions.Timeout(f"Timeout de {timeout:.0f}s agotado esperando capacidad hacia la API")
+
+        loop = asyncio.get_running_loop()
+        medicion = {"inicio": None}
+        try:
+            futuro = self.executor.submit(partial(self._enviar, medicion, metodo, url, timeout=timeout_efectivo, **kwargs))
+        except RuntimeError:
+            # Executor cerrado durante el apagado
+            if limite is not None:
+                limite.liberar()
+            raise
+        if limite is not None:
+            # El cupo se libera cuando termina la llamada en el hilo, aunque la solicitud que la originó
+            # se haya cancelado antes (plazo agotado, hedging): hasta entonces sigue en curso en la API
+            futuro.add_done_callback(partial(self._terminar_limitada, loop, limite, recortado))
+        try:
+            response = await asyncio.wrap_future(futuro)
+        except Exception as e:
+            if medicion["inicio"] is not None:
+                registrar_llamada_upstream(url, time.monotonic() - medicion["inicio"], type(e).__name__)
+            raise
+        registrar_llamada_upstream(url, response.elapsed.total_seconds(), response.status_code)
+        return response
+
+    def _enviar(self, medicion, metodo: str, url: str, **kwargs) -> requests.Response:
+        # Se mide desde que un hilo del pool toma la llamada, sin contar la espera por un hilo libre
+        medicion["inicio"] = time.monotonic()
+        return self.session.request(metodo, url, **kwargs)
+
+    def _terminar_limitada(self, loop: asyncio.AbstractEventLoop, limite, recortado: bool, futuro: Future):
+        try:
+            loop.call_soon_threadsafe(self._registrar_resultado, limite, recortado, futuro)
+        except RuntimeError:
+            # El event loop ya se cerró (apagado de la instancia)
+            pass
+
+    @staticmethod
+    def _registrar_resultado(limite, recortado: bool, futuro: Future):
+        if futuro.cancelled():
+            limite.liberar()
+            return
+        error = futuro.exception()
+        if error is None:
+            response = futuro.result()
+            limite.registrar(response.elapsed.total_seconds(), response.status_code in ESTADOS_SOBRECARGA)
+        elif isinstance(error, requests.exceptions.Timeout):
+            # Solo cuenta como sobrecarga si la API no respondió dentro del timeout completo de la etapa
+            limite.registrar(None, not recortado)
+        else:
+            limite.registrar(None, isinstance(error, requests.exceptions.RequestException))
+        limite.liberar()
+
+    async def post(self, url: str, timeout: float, **kwargs) -> requests.Response:
+        return await self.solicitar("POST", url, timeout, **kwargs)
+
+    async def get(self, url: str, timeout: float, **kwargs) -> requests.Response:
+        return await self.solicitar("GET", url, timeout, **kwargs)
+
+    async def calentar(self, url: str, conexiones: int) -> int:
+        """
+        Abre conexiones del pool hacia la API con solicitudes HEAD simultáneas (se ignora el código de respuesta)
+        para que las primeras solicitudes de una instancia nueva no paguen el establecimiento TCP/TLS
+        Retorna la cantidad de conexiones abiertas
+        """
+        resultados = await asyncio.gather(
+            *(self.solicitar("HEAD", url, timeout=10) for _ in range(min(conexiones, self.pool_size))),
+            return_exceptions=True
+        )
+        return sum(1 for resultado in resultados if not isinstance(resultado, Exception))
+
+    def metricas(self) -> Dict[str, Any]:
+        return {operacion: limite.metricas() for operacion, limite in self.limites.items()}
+
+    def cerrar(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+# Instancia compartida por todos los servicios
+cliente_upstream = ClienteUpstream()
@@ -1,12 +1,63 @@
 import requests
 import os
 import logging
+import asyncio
+import time
+from collections import deque
 from typing import Dict, Any, Optional
 from datetime import datetime
+from cliente_upstream import cliente_upstream
 
 logger = logging.getLogger(__name__)
 
 
+class HedgingConsulta:
+    """
+    Estado compartido del hedging de consultas de estado
+    Mantiene la ventana de latencias recientes y los contadores de hedges enviados y ganados
+    """
+
+    def __init__(self):
+        self.habilitado = os.getenv("HEDGING_ESTADO_HABILITADO", "false").lower() == "true"
+        self.percentil = float(os.getenv("HEDGING_ESTADO_PERCENTIL", "0.95"))
+        self.min_muestras = int(os.getenv("HEDGING_ESTADO_MIN_MUESTRAS", "20"))
+        self.latencias = deque(maxlen=int(os.getenv("HEDGING_ESTADO_VENTANA", "200")))
+        self.solicitudes = 0
+        self.hedges_enviados = 0
+        self.hedges_ganados = 0
+
+    def registrar_latencia(self, segundos: float):
+        self.latencias.append(segundos)
+
+    def umbral(self) -> Optional[float]:
+        """
+        Latencia a partir de la cual se envía la solicitud de respaldo (percentil configurado)
+        Retorna None mientras no haya suficientes muestras
+        """
+        if len(self.latencias) < self.min_muestras:
+            return None
+        ordenadas = sorted(self.latencias)
+        indice = min(len(ordenadas) - 1, int(self.percentil * len(ordenadas)))
+        return ordenadas[indice]
+
+    def metricas(self) -> Dict[str, Any]:
+        umbral = self.umbral()
+        return {
+            "habilitado": self.habilitado,
+            "solicitudes": self.solicitudes,
+            "hedges_enviados": self.hedges_enviados,
+            "hedges_ganados": self.hedges_ganados,
+            "tasa_hedge": round(self.hedges_enviados / self.solicitudes, 4) if self.solicitudes else 0.0,
+            "tasa_victoria": round(self.hedges_ganados / self.hedges_enviados, 4) if self.hedges_enviados else 0.0,
+            "umbral_segundos": round(umbral, 3) if umbral is not None else None,
+            "muestras": len(self.latencias)
+        }
+
+
+# Estadísticas compartidas por todas las instancias de ConsultarEstadoService
+hedging_consulta = HedgingConsulta()
+
+
 class ConsultarEstadoService:
     def __init__(self):
         self.base_url = os.getenv("API_BASE_URL", "https://stg-api-conecta.segurosbolivar.com/stage")
@@ -33,7 +84,7 @@ class ConsultarEstadoService:
 
             logger.info(f"Solicitando token OAuth2 para consulta estado: {url}")
 
-            response = requests.post(url, headers=headers, data=data, timeout=30)
+            response = await cliente_upstream.post(url, headers=headers, data=data, timeout=30)
 
             if response.status_code == 200:
                 token_data = response.json()
@@ -54,6 +105,57 @@ class ConsultarEstadoService:
             logger.error(error_msg)
             raise Exception(error_msg)
 
+    async def _get_medido(self, url: str, params: Dict[str, Any], headers: Dict[str, str],
+                          registrar: bool = True) -> requests.Response:
+        inicio = time.monotonic()
+        response = await cliente_upstream.get(url, params=params, headers=headers, timeout=30)
+        if registrar:
+            hedging_consulta.registrar_latencia(time.monotonic() - inicio)
+        return response
+
+    async def _get_estado(self, url: str, params: Dict[str, Any], headers: Dict[str, str]) -> requests.Response:
+        """
+        Ejecuta el GET de estado con hedging opcional: si la primera solicitud no responde dentro del
+        percentil configurado de latencia reciente, envía una segunda idéntica y usa la primera que responda.
+        Es seguro porque la consulta de estado es de solo lectura.
+        """
+        hedging_consulta.solicitudes += 1
+        umbral = hedging_consulta.umbral() if hedging_consulta.habilitado else None
+        if umbral is None:
+            return await self._get_medido(url, params, headers)
+
+        primera = asyncio.ensure_future(self._get_medido(url, params, headers))
+        terminadas, _ = await asyncio.wait({primera}, timeout=umbral)
+        if primera in terminadas:
+            return primera.result()
+
+        logger.info(f"Consulta de estado sin respuesta tras {umbral:.3f}s, enviando solicitud de respaldo")
+        hedging_consulta.hedges_enviados += 1
+        # Solo se registra la latencia de las solicitudes originales: la de respaldo es una muestra adicional
+        # que, si pierde, queda cancelada sin medirse y sesgaría la ventana
+        segunda = asyncio.ensure_future(self._get_medido(url, params, headers, registrar=False))
+
+        try:
+            pendientes = {primera, segunda}
+            while pendientes:
+                terminadas, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+                for tarea in terminadas:
+                    if tarea.exception() is None:
+                        if tarea is segunda:
+                            hedging_consulta.hedges_ganados += 1
+                        return tarea.result()
+
+            # Ambas fallaron: se propaga el error de la solicitud original
+            return primera.result()
+        finally:
+            # La original no se cancela aunque pierda: al terminar registra su latencia, para que la ventana
+            # incluya la cola lenta y el umbral siga siendo el percentil configurado. Su hilo sigue ocupado
+            # de todos modos hasta que la API responda. La de respaldo perdedora se descarta.
+            if not primera.done():
+                primera.add_done_callback(lambda tarea: tarea.cancelled() or tarea.exception())
+            if not segunda.done():
+                segunda.cancel()
+
     async def consultar_estado_siniestro(self,
                                          transaccion: str,
                                          p_cod_cia: str,
@@ -93,7 +195,7 @@ class ConsultarEstadoService:
             logger.info(f"URL: {url}")
             logger.info(f"Headers: {dict((k, v) for k, v in headers.items() if k != 'Authorization')}")
 
-            response = requests.get(url, params=params, headers=headers, timeout=30)
+            response = await self._get_estado(url, params, headers)
 
             if response.status_code == 200:
                 resultado = response.json()
@@ -106,7 +208,7 @@ class ConsultarEstadoService:
                 headers["Authorization"] = f"Bearer {self.token}"
 
                 # Reintentar
-                response = requests.get(url, params=params, headers=headers, timeout=30)
+                response = await self._get_estado(url, params, headers)
                 if response.status_code == 200:
                     resultado = response.json()
                     logger.info(f"Estado consultado exitosamente tras renovar token para transacción: {transaccion}")
@@ -154,8 +256,10 @@ class ConsultarEstadoService:
                         p_entidad_colocadora, p_proceso, p_sistema_origen]):
                 raise Exception("Faltan parámetros requeridos para la consulta")
 
-            # Paso 1: Obtener token de autenticación
-            await self.obtener_token()
+            # Paso 1: Obtener token de autenticación si no hay uno (el calentamiento o una solicitud previa
+            # ya lo dejan listo; un 401 lo renueva)
+            if not self.token:
+                await self.obtener_token()
 
             # Paso 2: Consultar estado
             resultado = await self.consultar_estado_siniestro(
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from starlette.responses import JSONResponse
+
+from drenado import drenado
+
+logger = logging.getLogger(__name__)
+
+# Límites por defecto por endpoint: (solicitudes en curso, solicitudes en cola)
+LIMITES_POR_DEFECTO = {
+    "/crear-siniestro": (20, 40),
+    "/consultar-estado": (50, 50),
+    "/pago-siniestro": (20, 20),
+    "/modificacion-reserva": (20, 20),
+    "/reserva-pago": (20, 20),
+    "/crear-siniestros-masivo": (2, 0),
+}
+
+
+class SolicitudRechazada(Exception):
+    def __init__(self, endpoint: str, retry_after: int):
+        super().__init__(f"Capacidad agotada para {endpoint}")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class LimiteEndpoint:
+    """
+    Limita las solicitudes en curso y en cola de un endpoint
+    Las solicitudes que exceden ambos límites se rechazan de inmediato
+    """
+
+    def __init__(self, endpoint: str, max_en_curso: int, max_cola: int, espera_maxima: float):
+        self.endpoint = endpoint
+        self.max_en_curso = max(1, max_en_curso)
+        self.max_cola = max(0, max_cola)
+        self.espera_maxima = espera_maxima
+        self.en_curso = 0
+        self._cola: deque = deque()
+        self.duracion_promedio = 1.0
+        self.admitidas = 0
+        self.rechazadas = 0
+
+    def retry_after(self) -> int:
+        """
+        Estima en segundos cuándo habrá capacidad, según la duración promedio de las solicitudes
+        """
+        tandas = (len(self._cola) + 1) / self.max_en_curso
+        return max(1, math.ceil(self.duracion_promedio * tandas))
+
+    def _rechazar(self) -> SolicitudRechazada:
+        self.rechazadas += 1
+        return SolicitudRechazada(self.endpoint, self.retry_after())
+
+    async def adquirir(self):
+        """
+        Obtiene un cupo de ejecución, esperando en cola si hay espacio
+        Lanza SolicitudRechazada si la cola está llena o la espera supera el máximo
+        """
+        if self.en_curso < self.max_en_curso and not self._cola:
+            self.en_curso += 1
+            self.admitidas += 1
+            return
+
+        if len(self._cola) >= self.max_cola:
+            raise self._rechazar()
+
+        turno = asyncio.get_running_loop().create_future()
+        self._cola.append(turno)
+        try:
+            await asyncio.wait_for(turno, self.espera_maxima)
+            self.admitidas += 1
+        except asyncio.TimeoutError:
+            raise self._rechazar()
+        except asyncio.CancelledError:
+            # Si el cupo ya había sido transferido a esta solicitud se devuelve
+            if turno.done() and not turno.cancelled():
+                self.liberar()
+            raise
+        finally:
+            if turno in self._cola:
+                self._cola.remove(turno)
+
+    def liberar(self, duracion: Optional[float] = None):
+        """
+        Libera un cupo transfiriéndolo directamente a la siguiente solicitud en cola
+        """
+        if duracion is not None:
+            self.duracion_promedio = 0.9 * self.duracion_promedio + 0.1 * duracion
+
+        while self._cola:
+            turno = self._cola.popleft()
+            if not turno.done():
+                turno.set_result(None)
+                return
+        self.en_curso -= 1
+
+    def metricas(self) -> Dict[str, Any]:
+        return {
+            "en_curso": self.en_curso,
+            "en_cola": len(self._cola),
+            "max_en_curso": self.max_en_curso,
+            "max_cola": self.max_cola,
+            "admitidas": self.admitidas,
+            "rechazadas": self.rechazadas,
+            "duracion_promedio_segundos": round(self.duracion_promedio, 3)
+        }
+
+
+class ControlAdmision:
+    """
+    Registro de límites de admisión por endpoint, configurables por variables de entorno:
+    ADMISION_<ENDPOINT>_MAX_EN_CURSO y ADMISION_<ENDPOINT>_MAX_COLA
+    (por ejemplo ADMISION_PAGO_SINIESTRO_MAX_EN_CURSO)
+    """
+
+    def __init__(self):
+        espera_maxima = float(os.getenv("ADMISION_ESPERA_MAXIMA_SEGUNDOS", "5"))
+        self.limites: Dict[str, LimiteEndpoint] = {}
+
+        for endpoint, (max_en_curso, max_cola) in LIMITES_POR_DEFECTO.items():
+            prefijo = "ADMISION_" + endpoint.strip("/").replace("-", "_").upper()
+            self.limites[endpoint] = LimiteEndpoint(
+                endpoint,
+                max_en_curso=int(os.getenv(f"{prefijo}_MAX_EN_CURSO", str(max_en_curso))),
+                max_cola=int(os.getenv(f"{prefijo}_MAX_COLA", str(max_cola))),
+                espera_maxima=espera_maxima
+            )
+
+    def metricas(self) -> Dict[str, Any]:
+        return {endpoint: limite.metricas() for endpoint, limite in self.limites.items()}
+
+
+class ControlAdmisionMiddleware:
+    """
+    Middleware ASGI que aplica el control de admisión antes de leer el cuerpo de la solicitud
+    El cupo se mantiene hasta que la respuesta termina de enviarse (incluye respuestas en streaming)
+    """
+
+    def __init__(self, app, control: ControlAdmision):
+        self.app = app
+        self.control = control
+
+    @staticmethod
+    async def _rechazar_por_drenado(scope, receive, send):
+        # La conexión se cierra para que el balanceador envíe los reintentos a otra instancia
+        response = JSONResponse(
+            status_code=503,
+            content={
+                "success": False,
+                "message": "La instancia se está apagando, intente nuevamente",
+                "error": "Instancia en apagado"
+            },
+            headers={"Retry-After": str(drenado.retry_after()), "Connection": "close"}
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        limite = self.control.limites.get(scope.get("path")) if scope["type"] == "http" else None
+        if limite is None:
+            await self.app(scope, receive, send)
+            return
+
+        if drenado.activo:
+            await self._rechazar_por_drenado(scope, receive, send)
+            return
+
+        try:
+            await limite.adquirir()
+        except SolicitudRechazada as e:
+            logger.warning(f"Solicitud rechazada por sobrecarga en {e.endpoint}, Retry-After: {e.retry_after}s")
+            response = JSONResponse(
+                status_code=503,
+                content={
+                    "success": False,
+                    "message": "Servicio sobrecargado, intente nuevamente más tarde",
+                    "error": str(e)
+                },
+                headers={"Retry-After": str(e.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        # Las solicitudes que esperaban en cola cuando empezó el apagado tampoco se inician
+        if drenado.activo:
+            limite.liberar()
+            await self._rechazar_por_drenado(scope, receive, send)
+            return
+
+        inicio = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limite.liberar(time.monotonic() - inicio)
@@ -4,6 +4,7 @@ import logging
 from datetime import datetime
 from typing import Dict, Any
 import json
+from cliente_upstream import cliente_upstream
 
 logger = logging.getLogger(__name__)
 
@@ -34,7 +35,7 @@ class CrearSiniestroService:
 
             logger.info(f"Solicitando token OAuth2 a: {url}")
 
-            response = requests.post(url, headers=headers, data=data, timeout=30)
+            response = await cliente_upstream.post(url, headers=headers, data=data, timeout=30)
 
             if response.status_code == 200:
                 token_data = response.json()
@@ -74,7 +75,7 @@ class CrearSiniestroService:
             logger.info(f"Creando siniestro en: {url}")
             logger.info(f"Payload: {json.dumps(payload, indent=2)}")
 
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
+            response = await cliente_upstream.post(url, headers=headers, json=payload, timeout=60)
 
             if response.status_code == 200 or response.status_code == 201:
                 resultado = response.json()
@@ -87,7 +88,7 @@ class CrearSiniestroService:
                 headers["Authorization"] = f"Bearer {self.token}"
 
                 # Reintentar
-                response = requests.post(url, headers=headers, json=payload, timeout=60)
+                response = await cliente_upstream.post(url, headers=headers, json=payload, timeout=60)
                 if response.status_code == 200 or response.status_code == 201:
                     resultado = response.json()
                     logger.info(f"Siniestro creado exitosamente tras renovar token: {resultado}")
@@ -118,8 +119,10 @@ class CrearSiniestroService:
         try:
             logger.info("Iniciando proceso de creación de siniestro")
 
-            # Paso 1: Obtener token de autenticación
-            await self.obtener_token()
+            # Paso 1: Obtener token de autenticación si no hay uno (el calentamiento o una solicitud previa
+            # ya lo dejan listo; un 401 lo renueva)
+            if not self.token:
+                await self.obtener_token()
 
             # Paso 2: El payload ya viene completo, solo enviarlo
             logger.info(f"Payload recibido: {json.dumps(payload_completo, indent=2)}")
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CANAL_POR_DEFECTO = "sin_canal"
+
+
+class CuotaExcedida(Exception):
+    def __init__(self, canal: str, motivo: str, retry_after: int):
+        super().__init__(f"Cuota excedida para el canal {canal}: {motivo}")
+        self.canal = canal
+        self.retry_after = retry_after
+
+
+def identificar_canal(headers, entidad_colocadora: Optional[str] = None, sistema_origen: Optional[str] = None,
+                      usuario_creacion: Optional[str] = None) -> str:
+    """
+    Identifica el canal de la solicitud como "entidad_colocadora/sim_sistema_origen/sim_usuario_creacion"
+    Usa los campos del body cuando existen y, si no, los encabezados X-Entidad-Colocadora,
+    X-Sistema-Origen y X-Usuario-Creacion
+    """
+    partes = (
+        entidad_colocadora or headers.get("x-entidad-colocadora") or CANAL_POR_DEFECTO,
+        sistema_origen or headers.get("x-sistema-origen") or CANAL_POR_DEFECTO,
+        usuario_creacion or headers.get("x-usuario-creacion") or CANAL_POR_DEFECTO,
+    )
+    return "/".join(str(parte) for parte in partes)
+
+
+class EstadoCanal:
+    """
+    Cuotas y cola de un canal: concurrencia máxima, tasa (token bucket), cola y peso
+    """
+
+    def __init__(self, canal: str, peso: float, max_en_curso: int, max_cola: int, tasa: float, rafaga: float):
+        self.canal = canal
+        self.peso = max(peso, 0.01)
+        self.max_en_curso = max(1, max_en_curso)
+        self.max_cola = max(0, max_cola)
+        self.tasa = tasa
+        self.rafaga = max(1.0, rafaga)
+        self.tokens = self.rafaga
+        self.ultima_recarga = time.monotonic()
+        self.en_curso = 0
+        self.cola: deque = deque()
+        self.ultimo_tag = 0.0
+        self.admitidas = 0
+        self.rechazadas = 0
+        self.espera_total = 0.0
+
+    def recargar_tokens(self):
+        ahora = time.monotonic()
+        self.tokens = min(self.rafaga, self.tokens + (ahora - self.ultima_recarga) * self.tasa)
+        self.ultima_recarga = ahora
+
+    def espera_por_tasa(self) -> float:
+        """
+        Segundos hasta que haya un token disponible (0 si la tasa no está limitada o hay tokens)
+        """
+        if self.tasa <= 0:
+            return 0.0
+        self.recargar_tokens()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.tasa
+
+    def consumir_token(self):
+        if self.tasa > 0:
+            self.tokens -= 1
+
+    def inactivo(self) -> bool:
+        return self.en_curso == 0 and not self.cola and self.espera_por_tasa() == 0 and self.tokens >= self.rafaga
+
+    def metricas(self) -> Dict[str, Any]:
+        return {
+            "peso": self.peso,
+            "en_curso": self.en_curso,
+            "en_cola": len(self.cola),
+            "admitidas": self.admitidas,
+            "rechazadas": self.rechazadas,
+            "espera_promedio_segundos": round(self.espera_total / self.admitidas, 4) if self.admitidas else 0.0
+        }
+
+
+class DespachadorJusto:
+    """
+    Despacho de solicitudes con cuotas por canal y cola justa ponderada (start-time fair queuing)
+    La capacidad global se reparte entre los canales con solicitudes en espera según su peso,
+    de modo que un canal ruidoso solo degrada su propia latencia.
+
+    Configuración por canal con CUOTAS_CANALES (JSON), buscando del más específico al más general:
+    {"183/194/1022365456": {...}, "183/194": {...}, "183": {"peso": 2, "max_en_curso": 10, "tasa": 5}}
+    Todos los canales que coinciden con una misma entrada comparten sus cuotas (una cuota por entidad o socio,
+    no por usuario). Los canales sin entrada configurada tienen cuotas propias con los valores por defecto,
+    salvo los que no identifican al usuario (sin X-Usuario-Creacion ni campo en el body): no se les aplican
+    cuotas por canal, solo la concurrencia global, para no agrupar a todos los clientes sin identificar en un solo canal.
+    """
+
+    def __init__(self):
+        self.max_concurrencia = max(1, int(os.getenv("CUOTAS_CONCURRENCIA_GLOBAL", "40")))
+        self.max_canales = int(os.getenv("CUOTAS_MAX_CANALES", "1000"))
+        self.por_defecto = {
+            "peso": float(os.getenv("CUOTAS_PESO_CANAL", "1")),
+            "max_en_curso": int(os.getenv("CUOTAS_MAX_EN_CURSO_CANAL", "10")),
+            "max_cola": int(os.getenv("CUOTAS_MAX_COLA_CANAL", "5")),
+            "tasa": float(os.getenv("CUOTAS_TASA_CANAL", "0")),
+            "rafaga": float(os.getenv("CUOTAS_RAFAGA_CANAL", "20")),
+        }
+        self.configuracion: Dict[str, Dict[str, Any]] = json.loads(os.getenv("CUOTAS_CANALES", "{}"))
+        self.canales: Dict[str, EstadoCanal] = {}
+        self.en_curso = 0
+        self.tiempo_virtual = 0.0
+
+    def _configuracion_canal(self, canal: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Retorna la clave de cuota del canal (la entrada configurada que coincide, o el canal mismo) y su configuración
+        """
+        partes = canal.split("/")
+        for n in range(len(partes), 0, -1):
+            clave = "/".join(partes[:n])
+            if clave in self.configuracion:
+                return clave, {**self.por_defecto, **self.configuracion[clave]}
+        if partes[-1] == CANAL_POR_DEFECTO:
+            return canal, {**self.por_defecto, "max_en_curso": self.max_concurrencia, "max_cola": math.inf, "tasa": 0}
+        return canal, self.por_defecto
+
+    def _estado(self, canal: str) -> EstadoCanal:
+        clave, configuracion = self._configuracion_canal(canal)
+        estado = self.canales.get(clave)
+        if estado is None:
+            if len(self.canales) >= self.max_canales:
+                self._depurar_canales()
+            estado = EstadoCanal(clave, **configuracion)
+            self.canales[clave] = estado
+        return estado
+
+    def _depurar_canales(self):
+        for canal in [canal for canal, estado in self.canales.items() if estado.inactivo()]:
+            del self.canales[canal]
+
+    def _siguiente_tag(self, estado: EstadoCanal) -> float:
+        tag = max(self.tiempo_virtual, estado.ultimo_tag) + 1 / estado.peso
+        estado.ultimo_tag = tag
+        return tag
+
+    def _despachar(self):
+        """
+        Asigna los cupos libres a las solicitudes en espera con menor tag virtual
+        entre los canales que no han alcanzado su concurrencia máxima
+        """
+        while self.en_curso < self.max_concurrencia:
+            elegido: Optional[EstadoCanal] = None
+            for estado in self.canales.values():
+                while estado.cola and estado.cola[0][1].done():
+                    estado.cola.popleft()
+                if estado.cola and estado.en_curso < estado.max_en_curso:
+                    if elegido is None or estado.cola[0][0] < elegido.cola[0][0]:
+                        elegido = estado
+
+            if elegido is None:
+                return
+
+            tag, turno = elegido.cola.popleft()
+            self.tiempo_virtual = tag
+            self.en_curso += 1
+            elegido.en_curso += 1
+            turno.set_result(None)
+
+    async def adquirir(self, canal: str, espera_maxima: Optional[float] = None, bloquear: bool = False):
+        """
+        Obtiene un cupo de despacho para el canal
+        Con bloquear=True (cargas masivas) se espera la tasa y la cola en lugar de rechazar
+        """
+        estado = self._estado(canal)
+
+        espera_tasa = estado.espera_por_tasa()
+        if espera_tasa > 0:
+            if not bloquear:
+                estado.rechazadas += 1
+                raise CuotaExcedida(estado.canal, "tasa de solicitudes", math.ceil(espera_tasa))
+            while espera_tasa > 0:
+                await asyncio.sleep(espera_tasa)
+                espera_tasa = estado.espera_por_tasa()
+
+        inicio = time.monotonic()
+
+        if self.en_curso < self.max_concurrencia and estado.en_curso < estado.max_en_curso \
+                and not any(otro.cola for otro in self.canales.values()):
+            estado.consumir_token()
+            self.tiempo_virtual = self._siguiente_tag(estado)
+            self.en_curso += 1
+            estado.en_curso += 1
+            estado.admitidas += 1
+            return
+
+        if not bloquear and len(estado.cola) >= estado.max_cola:
+            estado.rechazadas += 1
+            raise CuotaExcedida(estado.canal, "cola del canal llena", max(1, math.ceil(len(estado.cola) / estado.max_en_curso)))
+
+        # Las solicitudes rechazadas no consumen tokens ni avanzan el tag virtual del canal
+        estado.consumir_token()
+        tag = self._siguiente_tag(estado)
+        turno = asyncio.get_running_loop().create_future()
+        estado.cola.append((tag, turno))
+        self._despachar()
+
+        try:
+            await asyncio.wait_for(turno, espera_maxima)
+        except asyncio.TimeoutError:
+            estado.rechazadas += 1
+            raise CuotaExcedida(estado.canal, "tiempo máximo de espera en cola", 1)
+        except asyncio.CancelledError:
+            # Si el cupo ya había sido asignado a esta solicitud se devuelve
+            if turno.done() and not turno.cancelled():
+                self.liberar(canal)
+            raise
+
+        estado.admitidas += 1
+        estado.espera_total += time.monotonic() - inicio
+
+    def liberar(self, canal: str):
+        self.en_curso -= 1
+        estado = self.canales.get(self._configuracion_canal(canal)[0])
+        if estado is not None:
+            estado.en_curso -= 1
+        self._despachar()
+
+    @asynccontextmanager
+    async def turno(self, canal: str, espera_maxima: Optional[float] = None, bloquear: bool = False):
+        await self.adquirir(canal, espera_maxima, bloquear)
+        try:
+            yield
+        finally:
+            self.liberar(canal)
+
+    def metricas(self) -> Dict[str, Any]:
+        return {
+            "en_curso": self.en_curso,
+            "max_concurrencia": self.max_concurrencia,
+            "canales": {canal: estado.metricas() for canal, estado in self.canales.items()}
+        }
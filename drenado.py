@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SENALES_APAGADO = (signal.SIGTERM, signal.SIGINT)
+
+
+class SeguimientoInterrumpido(Exception):
+    """
+    La solicitud ya fue enviada a la API de Seguros Bolívar pero su seguimiento no alcanzó
+    a completarse antes del apagado (queda guardado para reanudarse) o del plazo de la solicitud
+    """
+
+    def __init__(self, seguimiento: Dict[str, Any], motivo: str = "apagado"):
+        descripcion = "apagado de la instancia" if motivo == "apagado" else "plazo de la solicitud agotado"
+        super().__init__(f"Seguimiento de {seguimiento['operacion']} interrumpido por {descripcion}")
+        self.seguimiento = seguimiento
+        self.motivo = motivo
+
+
+class Drenado:
+    """
+    Apagado ordenado de la instancia (reinicios de gunicorn, reducción de instancias en App Engine)
+    Al recibir SIGTERM deja de aceptar solicitudes nuevas (503), acorta las esperas previas a la consulta
+    de estado y da a las solicitudes en curso hasta DRENADO_PLAZO_SEGUNDOS para terminar. Las que ya
+    enviaron su operación a la API y no alcanzan a consultar el estado se guardan en un archivo de pendientes,
+    que se reanuda al volver a iniciar en el mismo host (el archivo es local: no sobrevive a la eliminación
+    de la instancia, por eso la respuesta 202 incluye los parámetros para que el cliente consulte el estado).
+    """
+
+    def __init__(self):
+        self.plazo = float(os.getenv("DRENADO_PLAZO_SEGUNDOS", "20"))
+        self.espera_maxima = float(os.getenv("DRENADO_ESPERA_MAXIMA_SEGUNDOS", "2"))
+        self.ruta_pendientes = os.getenv("DRENADO_PENDIENTES_ARCHIVO", "/tmp/siniestros_pendientes.ndjson")
+        self.activo = False
+        self.limite: Optional[float] = None
+        self.seguimientos: Dict[asyncio.Task, Dict[str, Any]] = {}
+        self.interrumpidos = 0
+        self.reanudados = 0
+        self._inicio: Optional[asyncio.Event] = None
+        self._vencido: Optional[asyncio.Event] = None
+
+    # Los eventos se crean dentro del event loop (en Python 3.9 quedan ligados al loop de su creación)
+    def _eventos(self):
+        if self._inicio is None:
+            self._inicio = asyncio.Event()
+            self._vencido = asyncio.Event()
+        return self._inicio, self._vencido
+
+    def restante(self) -> Optional[float]:
+        """
+        Segundos hasta el fin del drenado, o None si la instancia no se está apagando
+        """
+        return None if self.limite is None else self.limite - time.monotonic()
+
+    def iniciar(self):
+        """
+        Inicia el drenado; debe llamarse desde el event loop
+        """
+        if self.activo:
+            return
+        self.activo = True
+        self.limite = time.monotonic() + self.plazo
+        inicio, vencido = self._eventos()
+        inicio.set()
+        asyncio.get_running_loop().call_later(self.plazo, vencido.set)
+        logger.warning(
+            f"Drenado iniciado: {len(self.seguimientos)} seguimientos en curso, plazo {self.plazo:.0f}s"
+        )
+
+    def instalar_senales(self):
+        """
+        Inicia el drenado al recibir SIGTERM/SIGINT, sin reemplazar el manejo de uvicorn
+        uvicorn (con asyncio o uvloop) registra sus manejadores con loop.add_signal_handler, que recibe
+        las señales por el wakeup fd; el manejador de Python que se instala aquí se ejecuta además de ellos
+        y encadena el que existía. uvicorn deja de aceptar conexiones y espera las solicitudes en curso,
+        y el drenado acorta sus esperas y guarda los seguimientos que no alcanzan a terminar
+        """
+        loop = asyncio.get_running_loop()
+        for senal in SENALES_APAGADO:
+            previo = signal.getsignal(senal)
+
+            def manejador(numero, frame, previo=previo):
+                loop.call_soon_threadsafe(self.iniciar)
+                if callable(previo):
+                    previo(numero, frame)
+
+            try:
+                signal.signal(senal, manejador)
+            except ValueError:
+                # Solo el hilo principal puede instalar manejadores (por ejemplo, servidor en un hilo de pruebas)
+                return
+
+    def retry_after(self) -> int:
+        return max(1, int(self.restante() or 1))
+
+    async def dormir(self, segundos: float):
+        """
+        Espera entre etapas; si la instancia empieza a apagarse durante la espera,
+        la acorta a DRENADO_ESPERA_MAXIMA_SEGUNDOS
+        """
+        if not self.activo:
+            inicio, _ = self._eventos()
+            fin = time.monotonic() + segundos
+            try:
+                await asyncio.wait_for(inicio.wait(), segundos)
+            except asyncio.TimeoutError:
+                return
+            segundos = fin - time.monotonic()
+        await asyncio.sleep(max(0.0, min(segundos, self.espera_maxima)))
+
+    async def esperar_vencimiento(self):
+        _, vencido = self._eventos()
+        await vencido.wait()
+
+    def registrar_seguimiento(self, operacion: str, datos: Dict[str, Any], parametros_consulta: Dict[str, Any],
+                              detalle: Optional[str] = None, aplicadas: Optional[List[Dict[str, Any]]] = None):
+        """
+        Marca que la operación de la solicitud en curso ya fue enviada a la API y falta consultar su estado
+        La marca se retira al terminar la tarea de la solicitud; una etapa posterior reemplaza a la anterior.
+        aplicadas son las operaciones previas de la misma solicitud que ya se completaron
+        ({"operacion", "datos", "resultado"}) y deben quedar en el registro local si se interrumpe
+        """
+        tarea = asyncio.current_task()
+        if tarea not in self.seguimientos:
+            tarea.add_done_callback(self._terminar_seguimiento)
+        self.seguimientos[tarea] = {
+            "operacion": operacion,
+            "transaccion": datos.get("transaccion"),
+            "datos": datos,
+            "parametros_consulta": parametros_consulta,
+            "detalle": detalle,
+            "aplicadas": aplicadas or []
+        }
+
+    def observar(self, tarea: asyncio.Task) -> Dict[str, Any]:
+        """
+        Retorna un dict que, al terminar la tarea, contiene su último seguimiento (vacío si no tenía)
+        Debe llamarse antes de que la tarea empiece a ejecutarse, para que se complete antes de retirar la marca
+        """
+        final: Dict[str, Any] = {}
+        tarea.add_done_callback(lambda terminada: final.update(self.seguimientos.get(terminada) or {}))
+        return final
+
+    def _terminar_seguimiento(self, tarea: asyncio.Task):
+        self.seguimientos.pop(tarea, None)
+
+    def _guardar(self, seguimientos: List[Dict[str, Any]]):
+        with open(self.ruta_pendientes, "a", encoding="utf-8") as archivo:
+            for seguimiento in seguimientos:
+                archivo.write(json.dumps({**seguimiento, "fecha": datetime.now().isoformat()},
+                                         ensure_ascii=False, default=str) + "\n")
+
+    def interrumpir(self, tarea: asyncio.Task) -> Optional[Dict[str, Any]]:
+        """
+        Guarda el seguimiento pendiente de la tarea (si lo tiene) y la cancela
+        """
+        seguimiento = self.seguimientos.pop(tarea, None)
+        if seguimiento is not None:
+            # Las operaciones ya aplicadas las registra la respuesta de la solicitud interrumpida
+            self._guardar([{**seguimiento, "aplicadas": []}])
+            self.interrumpidos += 1
+            logger.warning(f"Seguimiento de {seguimiento['operacion']} guardado como pendiente: "
+                           f"transacción {seguimiento['transaccion']}")
+        tarea.cancel()
+        return seguimiento
+
+    def retirar(self, tarea: asyncio.Task) -> Optional[Dict[str, Any]]:
+        """
+        Retira el seguimiento de la tarea (si lo tiene) sin guardarlo como pendiente y la cancela
+        """
+        seguimiento = self.seguimientos.pop(tarea, None)
+        tarea.cancel()
+        return seguimiento
+
+    def guardar_pendientes(self):
+        """
+        Guarda los seguimientos que siguen abiertos al terminar el apagado
+        """
+        if self.seguimientos:
+            self._guardar(list(self.seguimientos.values()))
+            self.interrumpidos += len(self.seguimientos)
+            logger.warning(f"{len(self.seguimientos)} seguimientos guardados como pendientes en {self.ruta_pendientes}")
+            self.seguimientos.clear()
+
+    def tomar_pendientes(self) -> List[Dict[str, Any]]:
+        """
+        Lee y retira los seguimientos pendientes guardados por una instancia anterior
+        """
+        if not os.path.exists(self.ruta_pendientes):
+            return []
+        en_proceso = self.ruta_pendientes + ".reanudando"
+        os.replace(self.ruta_pendientes, en_proceso)
+        with open(en_proceso, encoding="utf-8") as archivo:
+            pendientes = [json.loads(linea) for linea in archivo if linea.strip()]
+        os.remove(en_proceso)
+        return pendientes
+
+    async def reanudar_pendientes(self, consulta_estado_service, registro_siniestros):
+        """
+        Consulta el estado de los seguimientos pendientes y guarda el resultado en el registro local
+        Los que vuelven a fallar se conservan para el siguiente inicio
+        """
+        try:
+            pendientes = await asyncio.to_thread(self.tomar_pendientes)
+        except (OSError, ValueError) as e:
+            logger.error(f"No se pudieron leer los seguimientos pendientes: {str(e)}")
+            return
+
+        fallidos = []
+        restantes = list(pendientes)
+        try:
+            while restantes:
+                pendiente = restantes[0]
+                try:
+                    resultado = await consulta_estado_service.procesar_consulta_estado(pendiente["parametros_consulta"])
+                except Exception as e:
+                    logger.warning(f"No se pudo reanudar el seguimiento de {pendiente['transaccion']}: {str(e)}")
+                    fallidos.append(pendiente)
+                else:
+                    for aplicada in pendiente.get("aplicadas", []):
+                        await registro_siniestros.registrar_async(
+                            aplicada["operacion"], aplicada["datos"], aplicada["resultado"]
+                        )
+                    await registro_siniestros.registrar_async(pendiente["operacion"], pendiente["datos"], resultado)
+                    self.reanudados += 1
+                restantes.pop(0)
+        finally:
+            # Si la instancia se apaga durante la reanudación, lo no procesado vuelve al archivo
+            if fallidos or restantes:
+                self._guardar(fallidos + restantes)
+        if pendientes:
+            logger.info(f"Seguimientos pendientes reanudados: {len(pendientes) - len(fallidos)} de {len(pendientes)}")
+
+    def metricas(self) -> Dict[str, Any]:
+        return {
+            "activo": self.activo,
+            "seguimientos_en_curso": len(self.seguimientos),
+            "interrumpidos": self.interrumpidos,
+            "reanudados": self.reanudados
+        }
+
+
+# Instancia compartida por los servicios, el middleware de admisión y la aplicación
+drenado = Drenado()
@@ -0,0 +1,67 @@
+import csv
+import io
+import json
+import zlib
+from typing import Any, Dict, Iterable, Iterator, Sequence
+
+from registro_siniestros import COLUMNAS_EXPORTACION
+
+# Formatos de exportación -> extensión del archivo (siempre comprimido con gzip)
+FORMATOS_EXPORTACION = {
+    "ndjson": "ndjson",
+    "csv": "csv",
+}
+
+# Bytes sin comprimir que se acumulan antes de pasar un bloque al compresor
+TAMANO_BLOQUE = 64 * 1024
+
+
+def lineas_ndjson(registros: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    for registro in registros:
+        yield (json.dumps(registro, ensure_ascii=False, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+
+
+def lineas_csv(registros: Iterable[Dict[str, Any]], columnas: Sequence[str]) -> Iterator[bytes]:
+    """
+    CSV con encabezado; el resultado de la consulta de estado (detalle) va como JSON en su columna
+    """
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=list(columnas), lineterminator="\n")
+    escritor.writeheader()
+    yield buffer.getvalue().encode("utf-8")
+    buffer.seek(0)
+    buffer.truncate()
+    for registro in registros:
+        if registro.get("resultado") is not None:
+            registro["resultado"] = json.dumps(registro["resultado"], ensure_ascii=False, default=str)
+        escritor.writerow(registro)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def comprimir_gzip(lineas: Iterable[bytes], tamano_bloque: int = TAMANO_BLOQUE) -> Iterator[bytes]:
+    """
+    Comprime en gzip a medida que se generan las líneas; la memoria queda acotada a un bloque
+    """
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    bloque = []
+    acumulado = 0
+    for linea in lineas:
+        bloque.append(linea)
+        acumulado += len(linea)
+        if acumulado >= tamano_bloque:
+            comprimido = compresor.compress(b"".join(bloque))
+            bloque = []
+            acumulado = 0
+            if comprimido:
+                yield comprimido
+    yield compresor.compress(b"".join(bloque)) + compresor.flush()
+
+
+def exportar_gzip(registros: Iterable[Dict[str, Any]], formato: str, detalle: bool = False) -> Iterator[bytes]:
+    if formato == "csv":
+        lineas = lineas_csv(registros, COLUMNAS_EXPORTACION + (("resultado",) if detalle else ()))
+    else:
+        lineas = lineas_ndjson(registros)
+    return comprimir_gzip(lineas)
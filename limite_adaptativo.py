@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Respuestas de la API que indican sobrecarga y reducen el límite
+ESTADOS_SOBRECARGA = (429, 500, 502, 503, 504)
+
+# Fracción del ajuste calculado que se aplica por cada tanda de llamadas
+SUAVIZADO = 0.2
+
+
+class CapacidadUpstreamAgotada(requests.exceptions.Timeout):
+    """
+    La llamada no obtuvo un cupo hacia la API dentro de su timeout
+    Hereda de Timeout para que los servicios la traten como cualquier timeout de la API
+    """
+
+    def __init__(self, operacion: str, segundos: float):
+        super().__init__(f"Sin capacidad hacia la API para {operacion} tras esperar {segundos:.1f}s")
+
+
+def _promedio_movil(actual: Optional[float], muestra: float, peso: float) -> float:
+    return muestra if actual is None else actual + peso * (muestra - actual)
+
+
+class LimiteAdaptativo:
+    """
+    Límite de llamadas en curso hacia una operación de la API de Seguros Bolívar, ajustado por gradiente de latencia
+    Compara la latencia reciente (promedio de ~10 llamadas) con la latencia base (percentil bajo de la reciente):
+    gradiente = tolerancia * base / reciente, entre 0.5 y 1. Por cada tanda de llamadas el límite se acerca a
+    límite * gradiente + raíz(límite): crece mientras la latencia se mantiene dentro de UPSTREAM_LIMITE_TOLERANCIA
+    y baja en proporción cuando la latencia sube. Ante 429, 5xx, errores de conexión o timeouts con el timeout
+    completo de la etapa (no los recortados por el plazo del cliente) se reduce por UPSTREAM_LIMITE_REDUCCION,
+    como máximo una vez por latencia reciente para que una ráfaga de errores de la misma tanda cuente una vez.
+    Las llamadas que exceden el límite esperan en cola (FIFO) dentro de su timeout.
+    """
+
+    def __init__(self, operacion: str, inicial: float, minimo: int, maximo: int, tolerancia: float,
+                 reduccion: float, adaptativo: bool = True, min_muestras: int = 20):
+        self.operacion = operacion
+        self.minimo = max(1, minimo)
+        self.maximo = max(self.minimo, maximo)
+        self.adaptativo = adaptativo
+        self.limite = float(min(max(inicial, self.minimo), self.maximo)) if adaptativo else float(self.maximo)
+        self.tolerancia = tolerancia
+        self.reduccion = reduccion
+        self.min_muestras = min_muestras
+        self.en_curso = 0
+        self._cola: deque = deque()
+        self.latencia_reciente: Optional[float] = None
+        self.latencia_base: Optional[float] = None
+        self._ultima_reduccion = 0.0
+        self.muestras = 0
+        self.errores = 0
+        self.esperas = 0
+        self.sin_capacidad = 0
+        self.reducciones_latencia = 0
+        self.reducciones_error = 0
+
+    def _capacidad(self) -> int:
+        return max(self.minimo, int(self.limite))
+
+    async def adquirir(self, espera_maxima: float):
+        """
+        Obtiene un cupo; si el límite está completo espera en cola hasta espera_maxima segundos
+        """
+        if self.en_curso < self._capacidad() and not self._cola:
+            self.en_curso += 1
+            return
+
+        self.esperas += 1
+        turno = asyncio.get_running_loop().create_future()
+        self._cola.append(turno)
+        inicio = time.monotonic()
+        try:
+            await asyncio.wait_for(turno, espera_maxima)
+        except asyncio.TimeoutError:
+            self.sin_capacidad += 1
+            raise CapacidadUpstreamAgotada(self.operacion, time.monotonic() - inicio)
+        except asyncio.CancelledError:
+            # Si el cupo ya había sido asignado a esta llamada se devuelve
+            if turno.done() and not turno.cancelled():
+                self.liberar()
+            raise
+        finally:
+            if turno in self._cola:
+                self._cola.remove(turno)
+
+    def liberar(self):
+        self.en_curso -= 1
+        self._despertar()
+
+    def _despertar(self):
+        # Tras una reducción los cupos liberados no se reasignan hasta quedar bajo el nuevo límite
+        while self._cola and self.en_curso < self._capacidad():
+            turno = self._cola.popleft()
+            if not turno.done():
+                self.en_curso += 1
+                turno.set_result(None)
+
+    def registrar(self, segundos: Optional[float], sobrecarga: bool):
+        """
+        Registra el resultado de una llamada terminada: su latencia, o que la API indicó sobrecarga
+        """
+        if sobrecarga:
+            self.errores += 1
+            if self.adaptativo and self._reducir(self.reduccion):
+                self.reducciones_error += 1
+                logger.warning(f"Límite hacia {self.operacion} reducido a {self.limite:.1f} por sobrecarga de la API")
+            return
+        if segundos is None:
+            return
+
+        self.muestras += 1
+        self.latencia_reciente = _promedio_movil(self.latencia_reciente, segundos, 0.1)
+        # La base sigue un percentil bajo de la latencia reciente: baja rápido cuando la API responde mejor
+        # y sube despacio (~1000 llamadas), para que una degradación sostenida no pase por normal enseguida
+        peso_base = 0.05 if self.latencia_base is None or self.latencia_reciente < self.latencia_base else 0.001
+        self.latencia_base = _promedio_movil(self.latencia_base, self.latencia_reciente, peso_base)
+        # Con menos de la mitad del límite en uso la latencia no dice nada de la capacidad de la API
+        if not self.adaptativo or self.muestras < self.min_muestras or self.en_curso < self.limite / 2:
+            return
+
+        gradiente = max(0.5, min(1.0, self.tolerancia * self.latencia_base / self.latencia_reciente))
+        # Cada llamada aplica 1/límite del ajuste: el límite cambia SUAVIZADO * (límite * (gradiente - 1) + raíz(límite))
+        # por cada tanda completa de llamadas en curso
+        anterior = self.limite
+        ajuste = SUAVIZADO * (anterior * (gradiente - 1) + math.sqrt(anterior)) / anterior
+        self.limite = min(self.maximo, max(float(self.minimo), anterior + ajuste))
+        if gradiente < 1 and int(self.limite) < int(anterior):
+            self.reducciones_latencia += 1
+            logger.info(
+                f"Límite hacia {self.operacion} reducido a {self.limite:.1f}: latencia reciente "
+                f"{self.latencia_reciente:.3f}s, base {self.latencia_base:.3f}s"
+            )
+        self._despertar()
+
+    def _reducir(self, factor: float) -> bool:
+        ahora = time.monotonic()
+        if ahora - self._ultima_reduccion < (self.latencia_reciente or 1.0):
+            return False
+        self._ultima_reduccion = ahora
+        self.limite = max(float(self.minimo), self.limite * factor)
+        return True
+
+    def metricas(self) -> Dict[str, Any]:
+        return {
+            "limite": round(self.limite, 2),
+            "en_curso": self.en_curso,
+            "en_cola": len(self._cola),
+            "latencia_reciente_segundos": round(self.latencia_reciente, 4) if self.latencia_reciente is not None else None,
+            "latencia_base_segundos": round(self.latencia_base, 4) if self.latencia_base is not None else None,
+            "muestras": self.muestras,
+            "errores_sobrecarga": self.errores,
+            "esperas": self.esperas,
+            "sin_capacidad": self.sin_capacidad,
+            "reducciones_latencia": self.reducciones_latencia,
+            "reducciones_error": self.reducciones_error
+        }
+
+
+def crear_limites(operaciones, maximo_por_defecto: int) -> Dict[str, LimiteAdaptativo]:
+    """
+    Límites por operación de la API, configurables con UPSTREAM_LIMITE_ADAPTATIVO, UPSTREAM_LIMITE_INICIAL,
+    UPSTREAM_LIMITE_MINIMO, UPSTREAM_LIMITE_MAXIMO, UPSTREAM_LIMITE_TOLERANCIA y UPSTREAM_LIMITE_REDUCCION
+    """
+    adaptativo = os.getenv("UPSTREAM_LIMITE_ADAPTATIVO", "true").lower() == "true"
+    return {
+        operacion: LimiteAdaptativo(
+            operacion,
+            inicial=float(os.getenv("UPSTREAM_LIMITE_INICIAL", "10")),
+            minimo=int(os.getenv("UPSTREAM_LIMITE_MINIMO", "2")),
+            maximo=int(os.getenv("UPSTREAM_LIMITE_MAXIMO", str(maximo_por_defecto))),
+            tolerancia=float(os.getenv("UPSTREAM_LIMITE_TOLERANCIA", "2")),
+            reduccion=float(os.getenv("UPSTREAM_LIMITE_REDUCCION", "0.7")),
+            adaptativo=adaptativo
+        )
+        for operacion in operaciones
+    }
@@ -1,12 +1,26 @@
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Header, Request, status, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, Any, List
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, field_validator, model_validator
+from typing import Dict, Any, List, Optional
+from datetime import date, timedelta
+import asyncio
+import codecs
 import logging
-from crear_siniestro import CrearSiniestroService
-from consultar_estado import ConsultarEstadoService
-from pago_siniestro import PagoSiniestroService
-from modificacion_reserva import ModificacionReservaService
+from consultar_estado import hedging_consulta
+from servicios import RegistroServicios
+from catalogo_referencia import CatalogoReferencia
+from control_admision import ControlAdmision, ControlAdmisionMiddleware
+from captura_trafico import CapturaTrafico, CapturaTraficoMiddleware
+from registro_siniestros import RegistroSiniestros, CAMPOS_RESUMEN
+from exportacion import FORMATOS_EXPORTACION, exportar_gzip
+from cuotas_canal import DespachadorJusto, CuotaExcedida, identificar_canal
+from perfilador import PerfiladorMuestreo, PerfiladorOcupado
+from monitor_event_loop import MonitorEventLoop
+from plazo_solicitud import PlazoAgotado, ClienteDesconectado, plazo_desde_headers, ejecutar_con_plazo
+from drenado import drenado, SeguimientoInterrumpido
+from reserva_pago import PAGO_NO_ENVIADO
+from cliente_upstream import cliente_upstream
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +32,14 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Control de admisión: limita solicitudes en curso y en cola por endpoint (503 + Retry-After)
+control_admision = ControlAdmision()
+app.add_middleware(ControlAdmisionMiddleware, control=control_admision)
+
+# Captura opcional de la forma del tráfico real (CAPTURA_TRAFICO_ARCHIVO), incluye las solicitudes rechazadas
+captura_trafico = CapturaTrafico()
+app.add_middleware(CapturaTraficoMiddleware, captura=captura_trafico)
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +49,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Catálogo local de códigos de referencia usado por las validaciones de los modelos
+catalogo_referencia = CatalogoReferencia()
+
 
 # Modelo para variables dinámicas
 class VariableDatos(BaseModel):
@@ -62,6 +87,16 @@ class SiniestroRequest(BaseModel):
     pol_principal: str
     vdatos_variables: list[VariableDatos]
 
+    @field_validator("cod_causa_sini")
+    @classmethod
+    def validar_causa(cls, valor):
+        return catalogo_referencia.validar("causas_siniestro", "cod_causa_sini", valor)
+
+    @model_validator(mode="after")
+    def validar_producto(self):
+        catalogo_referencia.validar_producto(self.cod_secc, self.cod_producto)
+        return self
+
 
 # Modelo para consulta de estado
 class ConsultaEstadoRequest(BaseModel):
@@ -106,6 +141,31 @@ class PagoSiniestroRequest(BaseModel):
     nro_exped: str
     tipo_exped: str
 
+    @field_validator("cod_cob")
+    @classmethod
+    def validar_cobertura(cls, valor):
+        return catalogo_referencia.validar("coberturas", "cod_cob", valor)
+
+    @field_validator("cod_concep_liq")
+    @classmethod
+    def validar_concepto_liquidacion(cls, valor):
+        return catalogo_referencia.validar("conceptos_liquidacion", "cod_concep_liq", valor)
+
+    @field_validator("cod_concep_rva")
+    @classmethod
+    def validar_concepto_reserva(cls, valor):
+        return catalogo_referencia.validar("conceptos_reserva", "cod_concep_rva", valor)
+
+    @field_validator("tipo_exped")
+    @classmethod
+    def validar_tipo_expediente(cls, valor):
+        return catalogo_referencia.validar("tipos_expediente", "tipo_exped", valor)
+
+    @model_validator(mode="after")
+    def validar_producto(self):
+        catalogo_referencia.validar_producto(self.seccion, self.producto)
+        return self
+
 
 # Modelo para datos de reserva
 class DatosReserva(BaseModel):
@@ -114,6 +174,16 @@ class DatosReserva(BaseModel):
     cod_concep_rva: int
     valor_movim: int
 
+    @field_validator("cod_cob")
+    @classmethod
+    def validar_cobertura(cls, valor):
+        return catalogo_referencia.validar("coberturas", "cod_cob", valor)
+
+    @field_validator("cod_concep_rva")
+    @classmethod
+    def validar_concepto_reserva(cls, valor):
+        return catalogo_referencia.validar("conceptos_reserva", "cod_concep_rva", valor)
+
 
 # Modelo para modificación de reserva
 class ModificacionReservaRequest(BaseModel):
@@ -126,12 +196,109 @@ class ModificacionReservaRequest(BaseModel):
     cod_cau_mod_ex: str
     vdatos_reserva: List[DatosReserva]
 
+    @field_validator("tipo_exped")
+    @classmethod
+    def validar_tipo_expediente(cls, valor):
+        return catalogo_referencia.validar("tipos_expediente", "tipo_exped", valor)
+
+    @model_validator(mode="after")
+    def validar_producto(self):
+        catalogo_referencia.validar_producto(self.cod_secc, self.cod_producto)
+        return self
+
+
+# Modelo para modificación de reserva seguida del pago
+class ReservaPagoRequest(BaseModel):
+    reserva: ModificacionReservaRequest
+    pago: PagoSiniestroRequest
+
+    @model_validator(mode="after")
+    def validar_siniestro(self):
+        if str(self.reserva.num_sini) != str(self.pago.num_sini):
+            raise ValueError("La reserva y el pago deben corresponder al mismo num_sini")
+        return self
+
+
+# Instanciar los componentes; los servicios se construyen al primer uso desde el registro compartido
+registro_siniestros = RegistroSiniestros()
+despachador = DespachadorJusto()
+perfilador = PerfiladorMuestreo()
+monitor_event_loop = MonitorEventLoop()
+servicios = RegistroServicios(SiniestroRequest, registro_siniestros, despachador)
+
+# Errores del despacho que se responden con su propio código HTTP (202, 429, 499, 504)
+ERRORES_DESPACHO = (PlazoAgotado, ClienteDesconectado, CuotaExcedida, SeguimientoInterrumpido)
+
+# Rutas de búsqueda en el registro local -> columna indexada
+BUSQUEDAS_REGISTRO = {
+    "poliza": "num_pol1",
+    "documento": "nro_documento",
+    "numero": "num_sini",
+    "transaccion": "transaccion",
+}
+
+
+@app.on_event("startup")
+async def iniciar_monitores():
+    """
+    Inicia el monitor de lag del event loop, encadena el drenado a las señales de apagado,
+    calienta el token y el pool de conexiones y reanuda los seguimientos pendientes que dejó la instancia anterior
+    """
+    monitor_event_loop.iniciar()
+    drenado.instalar_senales()
+    loop = asyncio.get_running_loop()
+    app.state.calentamiento = loop.create_task(servicios.calentar())
+    app.state.reanudacion = loop.create_task(
+        drenado.reanudar_pendientes(servicios.consulta_estado, registro_siniestros)
+    )
+
+
+@app.on_event("shutdown")
+async def detener_monitores():
+    """
+    Se ejecuta cuando ya terminaron las solicitudes en curso: guarda los seguimientos que quedaron abiertos
+    y cierra el monitor, la captura de tráfico, el pool de conexiones y el registro local
+    """
+    drenado.guardar_pendientes()
+    app.state.calentamiento.cancel()
+    app.state.reanudacion.cancel()
+    monitor_event_loop.detener()
+    captura_trafico.cerrar()
+    cliente_upstream.cerrar()
+    registro_siniestros.cerrar()
+
+
+async def despachar(http_request: Request, canal: str, operacion):
+    """
+    Ejecuta la operación de un endpoint aplicando la cuota y la cola justa del canal,
+    con el plazo de la solicitud
+    """
+    plazo = plazo_desde_headers(http_request.url.path, http_request.headers)
+    try:
+        await despachador.adquirir(canal, espera_maxima=max(0.0, plazo.restante()))
+    except BaseException:
+        operacion.close()
+        raise
+
+    try:
+        return await ejecutar_con_plazo(http_request, plazo, operacion)
+    finally:
+        despachador.liberar(canal)
+        perfilador.registrar_solicitud()
+
 
-# Instanciar los servicios
-siniestro_service = CrearSiniestroService()
-consulta_estado_service = ConsultarEstadoService()
-pago_siniestro_service = PagoSiniestroService()
-modificacion_reserva_service = ModificacionReservaService()
+def canal_operacion(http_request: Request, parametros_consulta: Dict[str, Any]) -> str:
+    """
+    Canal de pagos y reservas: su body no identifica al cliente, así que la entidad y el sistema de origen
+    son los encabezados X-* o, si no vienen, los que el servicio envía a la API. El usuario solo se conoce
+    por X-Usuario-Creacion; sin él no se aplican cuotas por canal (ver DespachadorJusto)
+    """
+    headers = http_request.headers
+    return identificar_canal(
+        headers,
+        headers.get("x-entidad-colocadora") or parametros_consulta["p_entidad_colocadora"],
+        headers.get("x-sistema-origen") or parametros_consulta["p_sistema_origen"]
+    )
 
 
 @app.get("/")
@@ -150,8 +317,82 @@ async def health_check():
     return {"status": "healthy", "service": "siniestros-api"}
 
 
+@app.get("/listo")
+async def listo():
+    """
+    Endpoint de preparación: la instancia está lista cuando obtuvo el token OAuth2
+    y abrió conexiones hacia la API, y no se está apagando
+    """
+    estado = servicios.estado()
+    estado["listo"] = estado["listo"] and not drenado.activo
+    return JSONResponse(status_code=200 if estado["listo"] else 503, content=estado)
+
+
+@app.get("/_ah/warmup")
+async def warmup():
+    """Solicitud de calentamiento de App Engine: responde cuando la instancia está lista"""
+    preparada = await servicios.esperar_listo()
+    return JSONResponse(status_code=200 if preparada else 503, content=servicios.estado())
+
+
+@app.get("/metricas")
+async def metricas():
+    """Endpoint de métricas operativas de la instancia"""
+    return {
+        "admision": control_admision.metricas(),
+        "hedging_consulta_estado": hedging_consulta.metricas(),
+        "cuotas_canal": despachador.metricas(),
+        "event_loop": monitor_event_loop.metricas(),
+        "captura_trafico": captura_trafico.metricas(),
+        "drenado": drenado.metricas(),
+        "limite_upstream": cliente_upstream.metricas()
+    }
+
+
+@app.post("/admin/perfilador", response_class=PlainTextResponse)
+async def perfilar(segundos: Optional[float] = None, solicitudes: Optional[int] = None,
+                   incluir_inactivos: bool = False, x_admin_token: Optional[str] = Header(None)):
+    """
+    Endpoint administrativo que activa el perfilador por muestreo durante N segundos o N solicitudes
+    Retorna las pilas en formato folded (flamegraph.pl / speedscope). Requiere el encabezado X-Admin-Token
+    """
+    if not perfilador.habilitado:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not perfilador.autorizado(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token de administración inválido")
+
+    try:
+        return await perfilador.perfilar(segundos, solicitudes, incluir_inactivos)
+    except PerfiladorOcupado as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+@app.get("/catalogo")
+async def consultar_catalogo():
+    """Endpoint que retorna el estado del catálogo local de códigos de referencia"""
+    return catalogo_referencia.resumen()
+
+
+@app.post("/catalogo/recargar")
+async def recargar_catalogo():
+    """
+    Endpoint para recargar el catálogo de referencia sin reiniciar la instancia
+    """
+    if not catalogo_referencia.recargar():
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"No se pudo recargar el catálogo desde: {catalogo_referencia.ruta}"
+        )
+
+    return {
+        "success": True,
+        "message": "Catálogo recargado exitosamente",
+        "data": catalogo_referencia.resumen()
+    }
+
+
 @app.post("/crear-siniestro")
-async def crear_siniestro(request: SiniestroRequest):
+async def crear_siniestro(request: SiniestroRequest, http_request: Request):
     """
     Endpoint principal para crear un siniestro
     Recibe los datos del siniestro y delega la creación al servicio correspondiente
@@ -160,7 +401,12 @@ async def crear_siniestro(request: SiniestroRequest):
         logger.info(f"Iniciando creación de siniestro para documento: {request.nro_documento}")
 
         # Delegar la creación del siniestro al servicio
-        resultado = await siniestro_service.procesar_siniestro(request.dict())
+        datos = request.dict()
+        canal = identificar_canal(
+            http_request.headers, request.entidad_colocadora, request.sim_sistema_origen, request.sim_usuario_creacion
+        )
+        resultado = await despachar(http_request, canal, servicios.crear_siniestro.procesar_siniestro(datos))
+        await registro_siniestros.registrar_async("creacion", datos, resultado)
 
         logger.info(f"Siniestro creado exitosamente para documento: {request.nro_documento}")
 
@@ -170,6 +416,8 @@ async def crear_siniestro(request: SiniestroRequest):
             "data": resultado
         }
 
+    except ERRORES_DESPACHO:
+        raise
     except Exception as e:
         logger.error(f"Error creando siniestro: {str(e)}")
         raise HTTPException(
@@ -178,8 +426,38 @@ async def crear_siniestro(request: SiniestroRequest):
         )
 
 
+@app.post("/crear-siniestros-masivo")
+async def crear_siniestros_masivo(archivo: UploadFile = File(...), formato: Optional[str] = None,
+                                  codificacion: Optional[str] = None):
+    """
+    Endpoint para la creación masiva de siniestros desde un archivo CSV o NDJSON
+    Procesa el archivo fila por fila y retorna los resultados en streaming como NDJSON
+    """
+    try:
+        formato_archivo = servicios.carga_masiva.detectar_formato(archivo.filename, archivo.content_type, formato)
+        if codificacion:
+            codecs.lookup(codificacion)
+    except LookupError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Codificación no soportada: {codificacion}"
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    logger.info(f"Iniciando carga masiva del archivo: {archivo.filename}")
+
+    return StreamingResponse(
+        servicios.carga_masiva.procesar_archivo(archivo.file, formato_archivo, codificacion),
+        media_type="application/x-ndjson"
+    )
+
+
 @app.post("/consultar-estado")
-async def consultar_estado_siniestro(request: ConsultaEstadoRequest):
+async def consultar_estado_siniestro(request: ConsultaEstadoRequest, http_request: Request):
     """
     Endpoint para consultar el estado de un siniestro
     Recibe el ID del siniestro y los parámetros requeridos
@@ -188,7 +466,10 @@ async def consultar_estado_siniestro(request: ConsultaEstadoRequest):
         logger.info(f"Iniciando consulta de estado para transacción: {request.transaccion}")
 
         # Delegar la consulta al servicio
-        resultado = await consulta_estado_service.procesar_consulta_estado(request.dict())
+        canal = identificar_canal(http_request.headers, request.p_entidad_colocadora, request.p_sistema_origen)
+        resultado = await despachar(
+            http_request, canal, servicios.consulta_estado.procesar_consulta_estado(request.dict())
+        )
 
         logger.info(f"Consulta de estado completada para transacción: {request.transaccion}")
 
@@ -198,6 +479,8 @@ async def consultar_estado_siniestro(request: ConsultaEstadoRequest):
             "data": resultado
         }
 
+    except ERRORES_DESPACHO:
+        raise
     except Exception as e:
         logger.error(f"Error consultando estado: {str(e)}")
         raise HTTPException(
@@ -207,7 +490,7 @@ async def consultar_estado_siniestro(request: ConsultaEstadoRequest):
 
 
 @app.post("/pago-siniestro")
-async def pagar_siniestro(request: PagoSiniestroRequest):
+async def pagar_siniestro(request: PagoSiniestroRequest, http_request: Request):
     """
     Endpoint para procesar pago de siniestro
     Recibe campos amigables y los transforma a códigos internos
@@ -216,7 +499,10 @@ async def pagar_siniestro(request: PagoSiniestroRequest):
         logger.info(f"Iniciando pago de siniestro: {request.num_sini}")
 
         # Delegar el pago al servicio
-        resultado = await pago_siniestro_service.procesar_pago_siniestro(request.dict())
+        datos = request.dict()
+        canal = canal_operacion(http_request, servicios.pago_siniestro.construir_parametros_consulta(datos))
+        resultado = await despachar(http_request, canal, servicios.pago_siniestro.procesar_pago_siniestro(datos))
+        await registro_siniestros.registrar_async("pago", datos, resultado)
 
         logger.info(f"Pago procesado exitosamente para siniestro: {request.num_sini}")
 
@@ -226,6 +512,8 @@ async def pagar_siniestro(request: PagoSiniestroRequest):
             "data": resultado
         }
 
+    except ERRORES_DESPACHO:
+        raise
     except Exception as e:
         logger.error(f"Error procesando pago: {str(e)}")
         raise HTTPException(
@@ -235,7 +523,7 @@ async def pagar_siniestro(request: PagoSiniestroRequest):
 
 
 @app.post("/modificacion-reserva")
-async def modificar_reserva(request: ModificacionReservaRequest):
+async def modificar_reserva(request: ModificacionReservaRequest, http_request: Request):
     """
     Endpoint para modificar la reserva de un siniestro
     Recibe los datos dinámicos y los combina con valores fijos del sistema
@@ -253,7 +541,11 @@ async def modificar_reserva(request: ModificacionReservaRequest):
         ]
 
         # Delegar la modificación al servicio
-        resultado = await modificacion_reserva_service.procesar_modificacion_reserva(request_dict)
+        canal = canal_operacion(http_request, servicios.modificacion_reserva.construir_parametros_consulta(request_dict))
+        resultado = await despachar(
+            http_request, canal, servicios.modificacion_reserva.procesar_modificacion_reserva(request_dict)
+        )
+        await registro_siniestros.registrar_async("reserva", request_dict, resultado)
 
         logger.info(f"Reserva modificada exitosamente para siniestro: {request.num_sini}")
 
@@ -263,6 +555,8 @@ async def modificar_reserva(request: ModificacionReservaRequest):
             "data": resultado
         }
 
+    except ERRORES_DESPACHO:
+        raise
     except Exception as e:
         logger.error(f"Error modificando reserva: {str(e)}")
         raise HTTPException(
@@ -271,6 +565,219 @@ async def modificar_reserva(request: ModificacionReservaRequest):
         )
 
 
+@app.post("/reserva-pago")
+async def reservar_y_pagar(request: ReservaPagoRequest, http_request: Request):
+    """
+    Endpoint para modificar la reserva y pagar un siniestro en una sola solicitud
+    Envía el pago en cuanto la reserva queda confirmada y consulta una vez el estado final
+    """
+    try:
+        logger.info(f"Iniciando reserva y pago para siniestro: {request.pago.num_sini}")
+
+        datos_reserva = request.reserva.dict()
+        datos_pago = request.pago.dict()
+
+        # Delegar la orquestación al servicio
+        canal = canal_operacion(http_request, servicios.modificacion_reserva.construir_parametros_consulta(datos_reserva))
+        resultado = await despachar(
+            http_request, canal, servicios.reserva_pago.procesar_reserva_pago(datos_reserva, datos_pago)
+        )
+        await registro_siniestros.registrar_async("reserva", datos_reserva, resultado["reserva"])
+        if not resultado["pago_enviado"]:
+            # La reserva quedó aplicada: 207 con su resultado para que el cliente reintente solo el pago
+            logger.warning(f"Reserva modificada sin pago para siniestro: {request.pago.num_sini}")
+            return JSONResponse(
+                status_code=207,
+                content={
+                    "success": False,
+                    "message": "Reserva modificada; el pago no se completó. Reintente solo /pago-siniestro",
+                    "data": resultado
+                }
+            )
+        await registro_siniestros.registrar_async("pago", datos_pago, resultado["pago"])
+
+        logger.info(f"Reserva y pago procesados exitosamente para siniestro: {request.pago.num_sini}")
+
+        return {
+            "success": True,
+            "message": "Reserva modificada y pago procesado",
+            "data": resultado
+        }
+
+    except ERRORES_DESPACHO:
+        raise
+    except Exception as e:
+        logger.error(f"Error en reserva y pago: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error en reserva y pago: {str(e)}"
+        )
+
+
+@app.get("/siniestros/{busqueda}/{valor}")
+async def buscar_siniestros(busqueda: str, valor: str, limite: int = 100):
+    """
+    Endpoint para consultar el registro local de siniestros sin llamar a la API de Seguros Bolívar
+    busqueda: poliza (num_pol1), documento (nro_documento), numero (num_sini) o transaccion
+    """
+    campo = BUSQUEDAS_REGISTRO.get(busqueda)
+    if campo is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Búsqueda no soportada: {busqueda}. Opciones: {', '.join(BUSQUEDAS_REGISTRO)}"
+        )
+
+    registros = await registro_siniestros.buscar_async(campo, valor, max(1, min(limite, 1000)))
+
+    return {
+        "success": True,
+        "message": f"{len(registros)} registros encontrados",
+        "data": registros
+    }
+
+
+def rango_fechas(desde: date, hasta: date):
+    """
+    Rango [desde, hasta] en días completos, como límites ISO comparables con la columna fecha del registro
+    """
+    if hasta < desde:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La fecha hasta debe ser igual o posterior a la fecha desde"
+        )
+    return desde.isoformat(), (hasta + timedelta(days=1)).isoformat()
+
+
+@app.get("/exportacion/movimientos")
+async def exportar_movimientos(desde: date, hasta: date, formato: str = "ndjson", detalle: bool = False):
+    """
+    Endpoint que exporta del registro local las creaciones, pagos (importe_liq, total_bruto_liq)
+    y reservas (valor_movim por cod_cob) entre dos fechas, en NDJSON o CSV comprimido con gzip
+    Se genera en streaming desde SQLite, sin llamar a la API de Seguros Bolívar
+    detalle: incluye el resultado de la consulta de estado de cada operación
+    """
+    if formato not in FORMATOS_EXPORTACION:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Formato no soportado: {formato}. Opciones: {', '.join(FORMATOS_EXPORTACION)}"
+        )
+    inicio, fin = rango_fechas(desde, hasta)
+    archivo = f"movimientos_{desde.isoformat()}_{hasta.isoformat()}.{FORMATOS_EXPORTACION[formato]}.gz"
+
+    # Generador síncrono: Starlette lo recorre en el threadpool, fuera del event loop
+    return StreamingResponse(
+        exportar_gzip(registro_siniestros.exportar(inicio, fin, detalle), formato, detalle),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{archivo}"'}
+    )
+
+
+@app.get("/exportacion/resumen")
+async def resumir_movimientos(desde: date, hasta: date, agrupar: str = "cod_cia,cod_secc,cod_producto",
+                              por_dia: bool = True):
+    """
+    Endpoint de totales de creaciones, pagos y reservas entre dos fechas, agrupados por día
+    y por cod_cia, cod_secc, cod_producto y/o cod_cob (calculados en SQLite)
+    """
+    campos = [campo.strip() for campo in agrupar.split(",") if campo.strip()]
+    no_soportados = [campo for campo in campos if campo not in CAMPOS_RESUMEN]
+    if no_soportados:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Agrupación no soportada: {', '.join(no_soportados)}. Opciones: {', '.join(CAMPOS_RESUMEN)}"
+        )
+    inicio, fin = rango_fechas(desde, hasta)
+    resumen = await registro_siniestros.resumir_async(inicio, fin, campos, por_dia)
+
+    return {
+        "success": True,
+        "message": f"{len(resumen)} grupos entre {desde.isoformat()} y {hasta.isoformat()}",
+        "data": resumen
+    }
+
+
+@app.exception_handler(PlazoAgotado)
+async def plazo_agotado_handler(request, exc):
+    """Manejador para solicitudes que agotaron su plazo"""
+    logger.warning(f"Plazo agotado en {request.url.path}: {str(exc)}")
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={
+            "success": False,
+            "message": "La solicitud no se completó dentro del plazo",
+            "error": str(exc)
+        }
+    )
+
+
+@app.exception_handler(ClienteDesconectado)
+async def cliente_desconectado_handler(request, exc):
+    """Manejador para solicitudes canceladas porque el cliente se desconectó"""
+    logger.warning(f"Solicitud cancelada en {request.url.path}: {str(exc)}")
+    return JSONResponse(
+        status_code=499,
+        content={
+            "success": False,
+            "message": "Solicitud cancelada por desconexión del cliente",
+            "error": str(exc)
+        }
+    )
+
+
+@app.exception_handler(SeguimientoInterrumpido)
+async def seguimiento_interrumpido_handler(request, exc):
+    """
+    Manejador para operaciones ya enviadas a la API cuyo seguimiento se interrumpió por el apagado
+    de la instancia o por el plazo de la solicitud: se registran las operaciones aplicadas y se informa
+    la transacción pendiente y el body para consultarla en /consultar-estado (que funciona desde cualquier
+    instancia) en lugar de reenviarla
+    """
+    seguimiento = exc.seguimiento
+    logger.warning(f"Seguimiento interrumpido en {request.url.path}: {str(exc)}")
+    for aplicada in seguimiento["aplicadas"]:
+        await registro_siniestros.registrar_async(aplicada["operacion"], aplicada["datos"], aplicada["resultado"])
+    await registro_siniestros.registrar_async(
+        seguimiento["operacion"], seguimiento["datos"], {"pendiente": True, "detalle": seguimiento["detalle"]}
+    )
+    pago_no_enviado = seguimiento["detalle"] == PAGO_NO_ENVIADO
+    if pago_no_enviado:
+        # /reserva-pago interrumpido antes de enviar el pago: solo la reserva pudo llegar a la API
+        mensaje = ("Reserva enviada; el pago no se envió. Verifique la reserva en /consultar-estado "
+                   "y envíe el pago por /pago-siniestro, sin repetir /reserva-pago")
+    elif exc.motivo == "apagado":
+        mensaje = "Operación enviada; la consulta de estado se completará en segundo plano. No reenvíe la solicitud"
+    else:
+        mensaje = "Operación enviada; el plazo se agotó antes de confirmar su estado. Consulte /consultar-estado antes de reenviarla"
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "success": not pago_no_enviado,
+            "pendiente": True,
+            "message": mensaje,
+            "operacion": seguimiento["operacion"],
+            "transaccion": seguimiento["transaccion"],
+            "detalle": seguimiento["detalle"],
+            "consulta": "/consultar-estado",
+            "parametros_consulta": seguimiento["parametros_consulta"]
+        }
+    )
+
+
+@app.exception_handler(CuotaExcedida)
+async def cuota_excedida_handler(request, exc):
+    """Manejador para solicitudes que exceden la cuota de su canal"""
+    logger.warning(f"Cuota excedida en {request.url.path}: {str(exc)}")
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={
+            "success": False,
+            "message": "Cuota del canal excedida, intente nuevamente más tarde",
+            "error": str(exc)
+        },
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Manejador global de excepciones"""
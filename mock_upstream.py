@@ -0,0 +1,134 @@
+"""
+API simulada de Seguros Bolívar para pruebas de carga y resistencia
+Implementa los endpoints usados por los servicios (token OAuth2, procesar y consulta de estado)
+con una latencia configurable por operación. Opcionalmente simula una capacidad limitada: procesar y estado
+atienden como máximo --capacidad llamadas a la vez (las demás esperan, y la latencia sube) y responden 429
+cuando hay más de --max-en-curso llamadas en curso.
+
+Uso:
+    python mock_upstream.py --puerto 8090 --latencia-ms 50
+    python mock_upstream.py --puerto 8090 --latencia-ms 50 --capacidad 8 --max-en-curso 30
+"""
+import argparse
+import asyncio
+import itertools
+import random
+from typing import Callable, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Operaciones simuladas: token, procesar y estado
+OPERACIONES = ("token", "procesar", "estado")
+
+
+def latencia_exponencial(media_ms: float) -> Callable[[str], float]:
+    """
+    Latencia aleatoria con distribución exponencial y la media indicada, igual para todas las operaciones
+    """
+    def latencia(operacion: str) -> float:
+        return random.expovariate(1000 / media_ms) if media_ms > 0 else 0.0
+    return latencia
+
+
+def latencia_empirica(muestras: Dict[str, List[float]], media_ms: float = 50) -> Callable[[str], float]:
+    """
+    Latencia tomada al azar de las muestras registradas de cada operación (distribución empírica)
+    Las operaciones sin muestras usan una latencia exponencial con la media indicada
+    """
+    por_defecto = latencia_exponencial(media_ms)
+
+    def latencia(operacion: str) -> float:
+        valores = muestras.get(operacion)
+        return random.choice(valores) if valores else por_defecto(operacion)
+    return latencia
+
+
+class CapacidadSimulada:
+    """
+    Capacidad limitada de la API simulada para procesar y estado: un número fijo de llamadas atendidas
+    a la vez y rechazo con 429 por encima de un máximo en curso
+    """
+
+    def __init__(self, capacidad: Optional[int] = None, max_en_curso: Optional[int] = None):
+        self.capacidad = capacidad
+        self.max_en_curso = max_en_curso
+        self.en_curso = 0
+        self.max_observado = 0
+        self.rechazadas = 0
+        self._semaforo: Optional[asyncio.Semaphore] = None
+
+    async def atender(self, espera: float) -> bool:
+        """
+        Atiende una llamada que tarda espera segundos; retorna False si se rechaza por sobrecarga
+        """
+        if self.max_en_curso is not None and self.en_curso >= self.max_en_curso:
+            self.rechazadas += 1
+            return False
+        self.en_curso += 1
+        self.max_observado = max(self.max_observado, self.en_curso)
+        try:
+            if self.capacidad is None:
+                await asyncio.sleep(espera)
+            else:
+                if self._semaforo is None:
+                    self._semaforo = asyncio.Semaphore(self.capacidad)
+                async with self._semaforo:
+                    await asyncio.sleep(espera)
+        finally:
+            self.en_curso -= 1
+        return True
+
+
+def sobrecarga() -> JSONResponse:
+    return JSONResponse(status_code=429, content={"message": "Too Many Requests"})
+
+
+def crear_app(latencia: Optional[Callable[[str], float]] = None,
+              capacidad: Optional[CapacidadSimulada] = None) -> FastAPI:
+    """
+    Crea la API simulada; latencia(operacion) retorna los segundos de espera de cada respuesta
+    """
+    latencia = latencia or latencia_exponencial(50)
+    capacidad = capacidad or CapacidadSimulada()
+    secuencia_siniestros = itertools.count(10008000000)
+    app = FastAPI(title="API simulada Seguros Bolívar")
+    app.state.capacidad = capacidad
+
+    @app.post("/oauth2/token")
+    async def token():
+        await asyncio.sleep(latencia("token"))
+        return {"access_token": "token-simulado", "token_type": "Bearer", "expires_in": 3600}
+
+    @app.post("/poliza_siniestros/api/v1/procesar")
+    async def procesar(request: Request):
+        payload = await request.json()
+        if not await capacidad.atender(latencia("procesar")):
+            return sobrecarga()
+        return {
+            "transaccion": payload.get("transaccion"),
+            "num_sini": payload.get("num_sini") or next(secuencia_siniestros),
+            "estado": "RECIBIDO"
+        }
+
+    @app.get("/poliza_siniestros/api/v1/proceso/estado")
+    async def estado(transaccion: str):
+        if not await capacidad.atender(latencia("estado")):
+            return sobrecarga()
+        return {"transaccion": transaccion, "estado": "PROCESADO"}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="API simulada de Seguros Bolívar")
+    parser.add_argument("--puerto", type=int, default=8090)
+    parser.add_argument("--latencia-ms", type=float, default=50, help="Latencia media de cada respuesta")
+    parser.add_argument("--capacidad", type=int, default=None, help="Llamadas de procesar/estado atendidas a la vez")
+    parser.add_argument("--max-en-curso", type=int, default=None, help="Llamadas en curso a partir de las que responde 429")
+    args = parser.parse_args()
+
+    uvicorn.run(crear_app(latencia_exponencial(args.latencia_ms), CapacidadSimulada(args.capacidad, args.max_en_curso)),
+                host="127.0.0.1", port=args.puerto, log_level="warning")
@@ -2,21 +2,23 @@ import requests
 import os
 import logging
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import json
-import asyncio
 from consultar_estado import ConsultarEstadoService
+from cliente_upstream import cliente_upstream
+from drenado import drenado
+import plazo_solicitud
 
 logger = logging.getLogger(__name__)
 
 
 class ModificacionReservaService:
-    def __init__(self):
+    def __init__(self, consulta_estado_service: Optional[ConsultarEstadoService] = None):
         self.base_url = os.getenv("API_BASE_URL", "https://stg-api-conecta.segurosbolivar.com/stage")
         self.client_id = os.getenv("CLIENT_ID", "42qjqldt7tp19ja02pjrfhhco")
         self.client_secret = os.getenv("CLIENT_SECRET", "quep14jpdaen4lngtj0rk8nvh7nv3sl2g0u2e5qh40cpgvti10q")
         self.token = None
-        self.consulta_estado_service = ConsultarEstadoService()
+        self.consulta_estado_service = consulta_estado_service or ConsultarEstadoService()
 
     async def obtener_token(self) -> str:
         """
@@ -37,7 +39,7 @@ class ModificacionReservaService:
 
             logger.info(f"Solicitando token OAuth2 para modificación de reserva: {url}")
 
-            response = requests.post(url, headers=headers, data=data, timeout=30)
+            response = await cliente_upstream.post(url, headers=headers, data=data, timeout=30)
 
             if response.status_code == 200:
                 token_data = response.json()
@@ -88,6 +90,20 @@ class ModificacionReservaService:
 
         return payload
 
+    def construir_parametros_consulta(self, datos_request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Construye los parámetros para consultar el estado de la modificación de reserva
+        """
+        return {
+            "transaccion": str(datos_request["transaccion"]),
+            "p_cod_cia": str(datos_request["cod_cia"]),
+            "p_cod_secc": str(datos_request["cod_secc"]),
+            "p_cod_producto": str(datos_request["cod_producto"]),
+            "p_entidad_colocadora": "183",  # Valor fijo
+            "p_proceso": "772",  # Valor fijo para modificación de reserva
+            "p_sistema_origen": "194"  # Valor fijo
+        }
+
     async def modificar_reserva_api(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """
         Envía la solicitud para modificar la reserva a la API de Seguros Bolívar
@@ -107,7 +123,7 @@ class ModificacionReservaService:
             logger.info(f"Modificando reserva en: {url}")
             logger.info(f"Payload: {json.dumps(payload, indent=2)}")
 
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
+            response = await cliente_upstream.post(url, headers=headers, json=payload, timeout=60)
 
             if response.status_code == 200 or response.status_code == 201:
                 resultado = response.json()
@@ -120,7 +136,7 @@ class ModificacionReservaService:
                 headers["Authorization"] = f"Bearer {self.token}"
 
                 # Reintentar
-                response = requests.post(url, headers=headers, json=payload, timeout=60)
+                response = await cliente_upstream.post(url, headers=headers, json=payload, timeout=60)
                 if response.status_code == 200 or response.status_code == 201:
                     resultado = response.json()
                     logger.info(f"Reserva modificada exitosamente tras renovar token: {resultado}")
@@ -151,34 +167,35 @@ class ModificacionReservaService:
         try:
             logger.info(f"Iniciando proceso de modificación de reserva para siniestro: {datos_request.get('num_sini')}")
 
-            # Paso 1: Obtener token de autenticación
-            await self.obtener_token()
+            # Paso 1: Obtener token de autenticación si no hay uno (el calentamiento o una solicitud previa
+            # ya lo dejan listo; un 401 lo renueva)
+            if not self.token:
+                await self.obtener_token()
 
             # Paso 2: Construir el payload
             payload = self.construir_payload_modificacion_reserva(datos_request)
 
+            # Preparar parámetros para la consulta de estado
+            parametros_consulta = self.construir_parametros_consulta(datos_request)
+
+            # El seguimiento se registra antes del envío: si la solicitud se interrumpe (apagado o plazo) con el
+            # POST en vuelo, la API pudo recibir la reserva y el cliente debe consultarla en lugar de reenviarla
+            drenado.registrar_seguimiento("reserva", datos_request, parametros_consulta, detalle="envío en curso")
+
             # Paso 3: Modificar la reserva
             resultado_modificacion = await self.modificar_reserva_api(payload)
 
+            # La reserva ya fue enviada: si la instancia se apaga antes de consultar el estado, queda pendiente
+            drenado.registrar_seguimiento("reserva", datos_request, parametros_consulta)
+
             logger.info("Modificación de reserva procesada exitosamente, esperando 10 segundos antes de consultar estado...")
 
             # Paso 4: Esperar 10 segundos para que el sistema procese
-            await asyncio.sleep(10)
+            await plazo_solicitud.dormir(10)
 
             # Paso 5: Consultar automáticamente el estado
             logger.info("Consultando estado automáticamente después de la modificación de reserva...")
 
-            # Preparar parámetros para la consulta de estado
-            parametros_consulta = {
-                "transaccion": str(datos_request["transaccion"]),
-                "p_cod_cia": str(datos_request["cod_cia"]),
-                "p_cod_secc": str(datos_request["cod_secc"]),
-                "p_cod_producto": str(datos_request["cod_producto"]),
-                "p_entidad_colocadora": "183",  # Valor fijo
-                "p_proceso": "772",  # Valor fijo para modificación de reserva
-                "p_sistema_origen": "194"  # Valor fijo
-            }
-
             logger.info(f"Parámetros para consulta estado: {parametros_consulta}")
 
             # Consultar estado usando el servicio
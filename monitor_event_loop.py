@@ -0,0 +1,126 @@
+import asyncio
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores (ms) de los buckets del histograma de lag
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+DIRECTORIO_APP = os.path.dirname(os.path.abspath(__file__))
+
+
+class MonitorEventLoop:
+    """
+    Mide cuánto se retrasa el event loop en ejecutar sus callbacks programados
+    Una tarea duerme intervalos fijos y registra el retraso en un histograma; un hilo vigilante
+    detecta cuando el loop lleva más del umbral sin responder y registra la pila del código
+    que lo está bloqueando (por ejemplo, llamadas síncronas dentro de un async def).
+    """
+
+    def __init__(self):
+        self.habilitado = os.getenv("MONITOR_LOOP_HABILITADO", "true").lower() == "true"
+        self.intervalo = float(os.getenv("MONITOR_LOOP_INTERVALO_MS", "100")) / 1000
+        self.umbral = float(os.getenv("MONITOR_LOOP_UMBRAL_MS", "200")) / 1000
+        self.histograma = [0] * (len(BUCKETS_MS) + 1)
+        self.muestras = 0
+        self.lag_total = 0.0
+        self.lag_maximo = 0.0
+        self.bloqueos = 0
+        self.bloqueos_por_ubicacion: Counter = Counter()
+        self._latido = time.monotonic()
+        self._id_hilo_loop: Optional[int] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self._detener = threading.Event()
+        self._vigilante: Optional[threading.Thread] = None
+
+    def _registrar_lag(self, lag: float):
+        self.muestras += 1
+        self.lag_total += lag
+        self.lag_maximo = max(self.lag_maximo, lag)
+        self.histograma[bisect.bisect_left(BUCKETS_MS, lag * 1000)] += 1
+
+    async def _medir(self):
+        while True:
+            esperado = time.monotonic() + self.intervalo
+            await asyncio.sleep(self.intervalo)
+            ahora = time.monotonic()
+            self._latido = ahora
+            self._registrar_lag(max(0.0, ahora - esperado))
+
+    @staticmethod
+    def _ubicacion_app(frame) -> Optional[str]:
+        """
+        Primera línea de código propio de la aplicación (desde el frame más interno)
+        """
+        while frame is not None:
+            archivo = frame.f_code.co_filename
+            if os.path.dirname(os.path.abspath(archivo)) == DIRECTORIO_APP and archivo != __file__:
+                return f"{os.path.basename(archivo)}:{frame.f_lineno} ({frame.f_code.co_name})"
+            frame = frame.f_back
+        return None
+
+    def _vigilar(self):
+        reportado = False
+        while not self._detener.wait(self.umbral / 2):
+            atraso = time.monotonic() - self._latido - self.intervalo
+            if atraso <= self.umbral:
+                reportado = False
+                continue
+            if reportado:
+                continue
+
+            # Un bloqueo se reporta una sola vez, con la pila capturada mientras ocurre
+            reportado = True
+            frame = sys._current_frames().get(self._id_hilo_loop)
+            if frame is None:
+                continue
+            ubicacion = self._ubicacion_app(frame) or "fuera de la aplicación"
+            pila = "".join(traceback.format_stack(frame))
+            frame = None
+
+            self.bloqueos += 1
+            self.bloqueos_por_ubicacion[ubicacion] += 1
+            logger.warning(
+                f"Event loop bloqueado por más de {atraso * 1000:.0f} ms en {ubicacion}. Pila:\n{pila}"
+            )
+
+    def iniciar(self):
+        """
+        Inicia la medición; debe llamarse desde el event loop (evento de startup)
+        """
+        if not self.habilitado or self._tarea is not None:
+            return
+        self._id_hilo_loop = threading.get_ident()
+        self._latido = time.monotonic()
+        self._detener.clear()
+        self._tarea = asyncio.get_running_loop().create_task(self._medir())
+        self._vigilante = threading.Thread(target=self._vigilar, name="monitor-event-loop", daemon=True)
+        self._vigilante.start()
+        logger.info(f"Monitor del event loop iniciado (intervalo {self.intervalo * 1000:.0f} ms, "
+                    f"umbral {self.umbral * 1000:.0f} ms)")
+
+    def detener(self):
+        self._detener.set()
+        if self._tarea is not None:
+            self._tarea.cancel()
+            self._tarea = None
+
+    def metricas(self) -> Dict[str, Any]:
+        etiquetas = [f"<={limite}ms" for limite in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        return {
+            "habilitado": self.habilitado,
+            "muestras": self.muestras,
+            "lag_promedio_ms": round(self.lag_total / self.muestras * 1000, 3) if self.muestras else 0.0,
+            "lag_maximo_ms": round(self.lag_maximo * 1000, 3),
+            "histograma": dict(zip(etiquetas, self.histograma)),
+            "bloqueos": self.bloqueos,
+            "bloqueos_por_ubicacion": dict(self.bloqueos_por_ubicacion.most_common(20))
+        }
@@ -0,0 +1,148 @@
+import asyncio
+import hmac
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Funciones hoja que indican un hilo inactivo (esperando trabajo o eventos de red)
+FUNCIONES_INACTIVAS = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+}
+
+# Marcos de corrutinas y generadores: la pila de una tarea hasta el código que ejecuta el event loop
+MARCOS_CORRUTINA = (inspect.CO_COROUTINE | inspect.CO_ITERABLE_COROUTINE | inspect.CO_ASYNC_GENERATOR
+                    | inspect.CO_GENERATOR)
+
+
+def marco_base_loop():
+    """
+    Marco de Python desde el que corre el event loop: el primero que no es una corrutina al recorrer
+    hacia afuera la pila de la tarea que llama. Con uvloop el loop está en C y, mientras espera eventos,
+    ese marco es la hoja de la pila del hilo (no hay marco de selectors.select). Con el loop de asyncio
+    retorna None: la espera ya se reconoce por selectors.select
+    """
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_flags & MARCOS_CORRUTINA:
+        frame = frame.f_back
+    if frame is None or (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) == ("events.py", "_run"):
+        return None
+    return frame
+
+
+class PerfiladorOcupado(Exception):
+    pass
+
+
+class PerfiladorMuestreo:
+    """
+    Perfilador por muestreo activable bajo demanda en la instancia en ejecución
+    Un hilo toma periódicamente la pila de todos los hilos (event loop y pool de llamadas a la API)
+    y acumula las pilas en formato "folded", compatible con flamegraph.pl y speedscope.
+    Mientras está apagado no hay hilo de muestreo y el costo es una comparación por solicitud.
+    """
+
+    def __init__(self):
+        self.token_admin = os.getenv("ADMIN_TOKEN")
+        self.intervalo = float(os.getenv("PERFILADOR_INTERVALO_MS", "10")) / 1000
+        self.max_segundos = float(os.getenv("PERFILADOR_MAX_SEGUNDOS", "120"))
+        self.activo = False
+        self._solicitudes_restantes: Optional[int] = None
+        self._fin_solicitudes: Optional[asyncio.Event] = None
+
+    @property
+    def habilitado(self) -> bool:
+        return bool(self.token_admin)
+
+    def autorizado(self, token: Optional[str]) -> bool:
+        return self.habilitado and token is not None and hmac.compare_digest(token, self.token_admin)
+
+    def registrar_solicitud(self):
+        """
+        Cuenta una solicitud completada; sin costo cuando el perfilador está apagado
+        """
+        if not self.activo or self._solicitudes_restantes is None:
+            return
+        self._solicitudes_restantes -= 1
+        if self._solicitudes_restantes <= 0:
+            self._fin_solicitudes.set()
+
+    @staticmethod
+    def _pila(frame, nombres_hilos: Dict[int, str], id_hilo: int, incluir_inactivos: bool) -> Optional[str]:
+        codigo = frame.f_code
+        if not incluir_inactivos and (os.path.basename(codigo.co_filename), codigo.co_name) in FUNCIONES_INACTIVAS:
+            return None
+
+        marcos = []
+        while frame is not None:
+            codigo = frame.f_code
+            marcos.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+            frame = frame.f_back
+        marcos.append(nombres_hilos.get(id_hilo, str(id_hilo)))
+        return ";".join(reversed(marcos))
+
+    def _muestrear(self, detener: threading.Event, muestras: Counter, incluir_inactivos: bool,
+                   hilo_loop: int, base_loop):
+        propio = threading.get_ident()
+        while not detener.is_set():
+            nombres_hilos = {hilo.ident: hilo.name for hilo in threading.enumerate()}
+            marcos = sys._current_frames()
+            for id_hilo, frame in marcos.items():
+                if id_hilo == propio:
+                    continue
+                # Event loop en C (uvloop) esperando eventos: no hay código de Python sobre su marco base
+                if not incluir_inactivos and id_hilo == hilo_loop and frame is base_loop:
+                    continue
+                pila = self._pila(frame, nombres_hilos, id_hilo, incluir_inactivos)
+                if pila:
+                    muestras[pila] += 1
+            # No retener referencias a los frames entre muestras
+            marcos = frame = None
+            detener.wait(self.intervalo)
+
+    async def perfilar(self, segundos: Optional[float] = None, solicitudes: Optional[int] = None,
+                       incluir_inactivos: bool = False) -> str:
+        """
+        Perfila durante N segundos o hasta completar N solicitudes (lo que ocurra primero,
+        con un máximo de PERFILADOR_MAX_SEGUNDOS) y retorna las pilas en formato folded
+        """
+        if self.activo:
+            raise PerfiladorOcupado("Ya hay un perfilado en curso")
+
+        duracion = min(segundos or self.max_segundos, self.max_segundos)
+        muestras: Counter = Counter()
+        detener = threading.Event()
+
+        self._fin_solicitudes = asyncio.Event()
+        self._solicitudes_restantes = solicitudes
+        self.activo = True
+        hilo = threading.Thread(
+            target=self._muestrear,
+            args=(detener, muestras, incluir_inactivos, threading.get_ident(), marco_base_loop()),
+            name="perfilador", daemon=True
+        )
+
+        inicio = time.monotonic()
+        logger.info(f"Perfilador activado: {duracion:.0f}s máximo, solicitudes: {solicitudes or 'sin límite'}")
+        hilo.start()
+        try:
+            await asyncio.wait_for(self._fin_solicitudes.wait(), duracion)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            detener.set()
+            await asyncio.to_thread(hilo.join)
+            self.activo = False
+            self._solicitudes_restantes = None
+
+        logger.info(f"Perfilador detenido tras {time.monotonic() - inicio:.1f}s con {sum(muestras.values())} muestras")
+        return "".join(f"{pila} {cantidad}\n" for pila, cantidad in muestras.most_common())
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Optional
+
+from drenado import drenado, SeguimientoInterrumpido
+
+logger = logging.getLogger(__name__)
+
+# Plazo máximo por defecto (segundos) de cada endpoint; los encabezados del cliente solo pueden acortarlo
+PLAZOS_POR_DEFECTO = {
+    "/crear-siniestro": 90.0,
+    "/consultar-estado": 60.0,
+    "/pago-siniestro": 120.0,
+    "/modificacion-reserva": 120.0,
+    "/reserva-pago": 150.0,
+}
+
+# Tiempo reservado al final del plazo para construir y enviar la respuesta
+MARGEN_RESPUESTA_SEGUNDOS = float(os.getenv("PLAZO_MARGEN_RESPUESTA_SEGUNDOS", "1"))
+
+
+class PlazoAgotado(Exception):
+    pass
+
+
+class ClienteDesconectado(Exception):
+    pass
+
+
+class Plazo:
+    """
+    Presupuesto de tiempo de una solicitud, compartido por todas sus etapas
+    (token, envío, espera y consulta de estado)
+    """
+
+    def __init__(self, segundos: float):
+        self.segundos = segundos
+        self.limite = time.monotonic() + segundos
+
+    def restante(self) -> float:
+        # Durante el apagado de la instancia el plazo no puede exceder el fin del drenado
+        restante_drenado = drenado.restante()
+        restante = self.limite - time.monotonic()
+        return restante if restante_drenado is None else min(restante, restante_drenado)
+
+    def agotado(self) -> bool:
+        return self.restante() <= 0
+
+
+_plazo_actual: ContextVar[Optional[Plazo]] = ContextVar("plazo_solicitud", default=None)
+
+
+def plazo_por_defecto(endpoint: str) -> float:
+    """
+    Plazo por defecto del endpoint, configurable con PLAZO_<ENDPOINT>_SEGUNDOS
+    """
+    variable = "PLAZO_" + endpoint.strip("/").replace("-", "_").upper() + "_SEGUNDOS"
+    return float(os.getenv(variable, str(PLAZOS_POR_DEFECTO.get(endpoint, 60.0))))
+
+
+def plazo_desde_headers(endpoint: str, headers) -> Plazo:
+    """
+    Construye el plazo de la solicitud a partir de los encabezados
+    X-Request-Timeout (segundos) y X-Request-Deadline (epoch Unix en segundos)
+    """
+    segundos = plazo_por_defecto(endpoint)
+
+    timeout = headers.get("x-request-timeout")
+    if timeout:
+        try:
+            segundos = min(segundos, float(timeout))
+        except ValueError:
+            logger.warning(f"Encabezado X-Request-Timeout inválido: {timeout}")
+
+    deadline = headers.get("x-request-deadline")
+    if deadline:
+        try:
+            segundos = min(segundos, float(deadline) - time.time())
+        except ValueError:
+            logger.warning(f"Encabezado X-Request-Deadline inválido: {deadline}")
+
+    return Plazo(segundos)
+
+
+def plazo_actual() -> Optional[Plazo]:
+    return _plazo_actual.get()
+
+
+def timeout(maximo: float) -> float:
+    """
+    Retorna el timeout a usar en una llamada a la API: el menor entre el máximo de la etapa
+    y el tiempo restante del plazo de la solicitud
+    """
+    plazo = _plazo_actual.get()
+    if plazo is None:
+        return maximo
+
+    restante = plazo.restante()
+    if restante <= 0:
+        raise PlazoAgotado("Plazo de la solicitud agotado")
+    return min(maximo, restante)
+
+
+async def dormir(segundos: float):
+    """
+    Espera entre etapas sin exceder el plazo de la solicitud,
+    dejando margen para la etapa siguiente y la respuesta
+    """
+    plazo = _plazo_actual.get()
+    if plazo is not None:
+        segundos = min(segundos, max(0.0, plazo.restante() - MARGEN_RESPUESTA_SEGUNDOS))
+    await drenado.dormir(segundos)
+
+
+async def _esperar_desconexion(request):
+    while True:
+        mensaje = await request.receive()
+        if mensaje["type"] == "http.disconnect":
+            return
+
+
+async def ejecutar_con_plazo(request, plazo: Plazo, operacion: Awaitable[Any]) -> Any:
+    """
+    Ejecuta la operación con el plazo de la solicitud
+    La operación se cancela si se agota el plazo o si el cliente se desconecta; si termina el drenado
+    de la instancia y la operación ya fue enviada a la API, su seguimiento se guarda como pendiente.
+    Si se agota el plazo con la operación ya enviada, se informa su seguimiento en lugar de un 504,
+    para que el cliente consulte el estado antes de reenviarla
+    """
+    contexto = _plazo_actual.set(plazo)
+    try:
+        tarea = asyncio.ensure_future(operacion)
+        seguimiento_final = drenado.observar(tarea)
+        vigilante = asyncio.ensure_future(_esperar_desconexion(request))
+        vencimiento = asyncio.ensure_future(drenado.esperar_vencimiento())
+    finally:
+        _plazo_actual.reset(contexto)
+
+    try:
+        terminadas, _ = await asyncio.wait(
+            {tarea, vigilante, vencimiento},
+            timeout=max(0.0, plazo.restante()),
+            return_when=asyncio.FIRST_COMPLETED
+        )
+
+        if tarea not in terminadas and (vencimiento in terminadas or drenado.activo):
+            seguimiento = drenado.interrumpir(tarea)
+            if seguimiento is not None:
+                raise SeguimientoInterrumpido(seguimiento)
+
+        if not terminadas:
+            seguimiento = drenado.retirar(tarea)
+            if seguimiento is not None:
+                raise SeguimientoInterrumpido(seguimiento, motivo="plazo")
+
+        if tarea in terminadas:
+            try:
+                return tarea.result()
+            except Exception as e:
+                if plazo.agotado():
+                    # El envío a la API agotó su timeout con el plazo: pudo haberse recibido
+                    if seguimiento_final:
+                        raise SeguimientoInterrumpido(dict(seguimiento_final), motivo="plazo") from e
+                    raise PlazoAgotado(f"Plazo de {plazo.segundos:.1f}s agotado: {str(e)}") from e
+                raise
+
+        if vigilante in terminadas:
+            raise ClienteDesconectado("El cliente se desconectó antes de completar la solicitud")
+
+        raise PlazoAgotado(f"Plazo de {plazo.segundos:.1f}s agotado")
+    finally:
+        vigilante.cancel()
+        vencimiento.cancel()
+        if not tarea.done():
+            tarea.cancel()
@@ -0,0 +1,389 @@
+"""
+Prueba de resistencia (soak) con detección de crecimiento de memoria
+Levanta la API en este mismo proceso contra la API simulada (mock_upstream.py), genera carga constante
+durante el tiempo indicado y toma periódicamente snapshots de tracemalloc y muestras de RSS.
+Reporta el crecimiento por sitio de asignación y por categoría (servicios, payloads registrados en logs,
+caches, tareas en curso) y termina con código 1 si la memoria por solicitud supera el umbral.
+
+Uso:
+    python prueba_resistencia.py --duracion 7200 --rps 10
+    python prueba_resistencia.py --duracion 60 --rps 20 --mezcla crear=1,consultar=1
+"""
+import argparse
+import asyncio
+import gc
+import itertools
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+# Categoría de cada sitio de asignación según el archivo donde ocurre
+CATEGORIAS = {
+    "crear_siniestro.py": "servicios",
+    "consultar_estado.py": "servicios",
+    "pago_siniestro.py": "servicios",
+    "modificacion_reserva.py": "servicios",
+    "reserva_pago.py": "servicios",
+    "carga_masiva.py": "servicios",
+    "cliente_upstream.py": "servicios",
+    "logging/__init__.py": "payloads en logs",
+    "json/encoder.py": "payloads en logs",
+    "catalogo_referencia.py": "caches",
+    "cuotas_canal.py": "caches",
+    "registro_siniestros.py": "caches",
+    "control_admision.py": "caches",
+    "monitor_event_loop.py": "caches",
+    "asyncio/": "tareas en curso",
+}
+
+# Asignaciones que provoca la propia medición (pilas formateadas, snapshots) y no la API
+FILTROS_MEDICION = (
+    tracemalloc.Filter(False, "*/linecache.py"),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+)
+
+CLASES_SERVICIO = (
+    "CrearSiniestroService", "ConsultarEstadoService", "PagoSiniestroService",
+    "ModificacionReservaService", "ReservaPagoService", "CargaMasivaService",
+)
+
+MEZCLA_POR_DEFECTO = "crear=5,consultar=3,pago=1,reserva=1"
+
+ENDPOINTS = {
+    "crear": "/crear-siniestro",
+    "consultar": "/consultar-estado",
+    "pago": "/pago-siniestro",
+    "reserva": "/modificacion-reserva",
+}
+
+
+def construir_solicitud(operacion: str, numero: int, variables: int = 2, reservas: int = 1,
+                        usuario: str = "prueba") -> Dict[str, Any]:
+    """
+    Construye un body válido para el endpoint de la operación
+    variables y reservas controlan el largo de vdatos_variables y vdatos_reserva
+    """
+    transaccion = str(9000000 + numero)
+    if operacion == "crear":
+        return {
+            "proceso": "1", "entidad_colocadora": "183", "sim_sistema_origen": "194",
+            "transaccion": transaccion, "cod_cia": "2", "cod_secc": "22", "cod_producto": "735",
+            "tdoc_tercero_aseg": "CC", "cod_aseg": "1", "tdoc_tercero_tom": "CC",
+            "nro_documento": str(1000000 + numero % 5000), "num_pol1": str(2000000 + numero % 2000),
+            "cod_ries": "1", "cod_causa_sini": "1", "fec_denu_sini": "2025-01-01", "fecha_sini": "2025-01-01",
+            "hora_sini": "10:00", "desc_sini": "Siniestro de prueba de carga", "sim_fec_formalizac": "2025-01-01",
+            "sim_usuario_creacion": usuario, "pol_principal": "N",
+            "vdatos_variables": [
+                {"cod_modulo": "1", "cod_nivel": "1", "cod_grupo": "1", "cod_campo": f"CAMPO{i}", "valor_campo": "X" * 20}
+                for i in range(variables)
+            ]
+        }
+    if operacion == "consultar":
+        return {
+            "transaccion": transaccion, "p_cod_cia": "2", "p_cod_secc": "22", "p_cod_producto": "735",
+            "p_entidad_colocadora": "183", "p_proceso": "1", "p_sistema_origen": "194"
+        }
+    if operacion == "pago":
+        return {
+            "transaccion": transaccion, "num_sini": str(10008000000 + numero), "compania": "2", "seccion": "22",
+            "producto": "735", "num_pol1": str(2000000 + numero % 2000), "cod_act_benef": "1", "tdoc_tercero": "CC",
+            "cod_benef": "1", "nro_factura": str(numero), "fecha_factura": "2025-01-01", "localida_factura": "1",
+            "factura_exenta": "N", "con_iva_sim": "N", "cod_texto": "1", "sub_cod_texto": "1", "tipo_liq": "1",
+            "total_bruto_liq": 50000, "autorizante": "1", "fecha_liq": "2025-01-01", "cod_pago": 1,
+            "cod_mon_liq": 1, "sub_tipo_ordpago": "1", "cod_cob": "663", "cod_concep_liq": 1,
+            "importe_liq": 50000, "cod_concep_rva": 69, "nro_exped": "1", "tipo_exped": "GSO"
+        }
+    if operacion == "reserva":
+        return {
+            "transaccion": transaccion, "cod_cia": 2, "cod_secc": 22, "num_sini": 10008000000 + numero,
+            "cod_producto": 735, "tipo_exped": "GSO", "cod_cau_mod_ex": "92",
+            "vdatos_reserva": [
+                {"cod_mon": 1, "cod_cob": 663, "cod_concep_rva": 69, "valor_movim": 50000} for _ in range(reservas)
+            ]
+        }
+    raise ValueError(f"Operación desconocida: {operacion}")
+
+
+def rss_bytes() -> int:
+    """
+    Memoria residente actual del proceso
+    """
+    try:
+        with open("/proc/self/status") as archivo:
+            for linea in archivo:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def categoria(archivo: str) -> str:
+    archivo = archivo.replace(os.sep, "/")
+    for sufijo, nombre in CATEGORIAS.items():
+        if archivo.endswith(sufijo) or sufijo in archivo:
+            return nombre
+    return "otros"
+
+
+class ServidorEnHilo(threading.Thread):
+    """
+    Ejecuta una app ASGI con uvicorn en un hilo, exponiendo su event loop
+    """
+
+    def __init__(self, app, puerto: int):
+        super().__init__(daemon=True, name=f"servidor-{puerto}")
+        import uvicorn
+        self.servidor = uvicorn.Server(uvicorn.Config(
+            app, host="127.0.0.1", port=puerto, log_level="warning", timeout_keep_alive=120
+        ))
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def run(self):
+        async def servir():
+            self.loop = asyncio.get_running_loop()
+            await self.servidor.serve()
+        asyncio.run(servir())
+
+    def esperar_inicio(self, timeout: float = 30):
+        limite = time.monotonic() + timeout
+        while not self.servidor.started:
+            if time.monotonic() > limite:
+                raise RuntimeError("El servidor no inició a tiempo")
+            time.sleep(0.05)
+
+    def detener(self):
+        self.servidor.should_exit = True
+        self.join(timeout=30)
+
+
+class GeneradorCarga:
+    """
+    Genera carga constante (solicitudes por segundo) con la mezcla de operaciones indicada
+    """
+
+    def __init__(self, url_base: str, rps: float, mezcla: List[Tuple[str, float]], hilos: int):
+        self.url_base = url_base
+        self.rps = rps
+        self.operaciones = [operacion for operacion, _ in mezcla]
+        self.pesos = [peso for _, peso in mezcla]
+        self.hilos = hilos
+        self.secuencia = itertools.count()
+        self.resultados: Counter = Counter()
+        self.completadas = 0
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._trabajadores: List[threading.Thread] = []
+
+    def _trabajar(self, indice: int):
+        sesion = requests.Session()
+        # Cada hilo simula un usuario distinto para que las cuotas por canal repartan la carga
+        usuario = f"prueba{indice}"
+        sesion.headers.update({"X-Entidad-Colocadora": "183", "X-Sistema-Origen": "194", "X-Usuario-Creacion": usuario})
+        intervalo = self.hilos / self.rps
+        proximo = time.monotonic() + intervalo * indice / self.hilos
+        while not self._detener.is_set():
+            espera = proximo - time.monotonic()
+            if espera > 0 and self._detener.wait(espera):
+                break
+            proximo += intervalo
+
+            operacion = random.choices(self.operaciones, self.pesos)[0]
+            numero = next(self.secuencia)
+            try:
+                response = sesion.post(
+                    self.url_base + ENDPOINTS[operacion], json=construir_solicitud(operacion, numero, usuario=usuario),
+                    timeout=180
+                )
+                resultado = f"{operacion}:{response.status_code}"
+            except requests.exceptions.RequestException as e:
+                resultado = f"{operacion}:{type(e).__name__}"
+            with self._lock:
+                self.resultados[resultado] += 1
+                self.completadas += 1
+
+    def iniciar(self):
+        for indice in range(self.hilos):
+            hilo = threading.Thread(target=self._trabajar, args=(indice,), daemon=True, name=f"carga-{indice}")
+            hilo.start()
+            self._trabajadores.append(hilo)
+
+    def detener(self):
+        self._detener.set()
+        for hilo in self._trabajadores:
+            hilo.join(timeout=200)
+
+
+def tomar_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(FILTROS_MEDICION)
+
+
+def contar_tareas(loop) -> int:
+    async def contar():
+        return len(asyncio.all_tasks())
+    return asyncio.run_coroutine_threadsafe(contar(), loop).result(timeout=10)
+
+
+def contar_servicios() -> Dict[str, int]:
+    conteo: Counter = Counter()
+    for objeto in gc.get_objects():
+        nombre = type(objeto).__name__
+        if nombre in CLASES_SERVICIO:
+            conteo[nombre] += 1
+    return dict(conteo)
+
+
+def parsear_mezcla(texto: str) -> List[Tuple[str, float]]:
+    mezcla = []
+    for parte in texto.split(","):
+        operacion, peso = parte.split("=")
+        if operacion not in ENDPOINTS:
+            raise ValueError(f"Operación desconocida en la mezcla: {operacion}")
+        mezcla.append((operacion.strip(), float(peso)))
+    return mezcla
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Prueba de resistencia con detección de fugas de memoria")
+    parser.add_argument("--duracion", type=float, default=7200, help="Duración total en segundos (default: 2 horas)")
+    parser.add_argument("--calentamiento", type=float, default=None,
+                        help="Segundos antes de tomar la línea base (default: 10%% de la duración)")
+    parser.add_argument("--rps", type=float, default=10, help="Solicitudes por segundo")
+    parser.add_argument("--hilos", type=int, default=64,
+                        help="Hilos generadores de carga (pago y reserva esperan 10s cada uno)")
+    parser.add_argument("--mezcla", default=MEZCLA_POR_DEFECTO, help="Pesos por operación")
+    parser.add_argument("--intervalo-muestra", type=float, default=60, help="Segundos entre snapshots")
+    parser.add_argument("--latencia-ms", type=float, default=50, help="Latencia media de la API simulada")
+    parser.add_argument("--umbral-bytes-solicitud", type=float, default=1024,
+                        help="Crecimiento máximo de memoria trazada por solicitud tras el calentamiento")
+    parser.add_argument("--umbral-rss-bytes-solicitud", type=float, default=4096,
+                        help="Crecimiento máximo de RSS por solicitud tras el calentamiento")
+    parser.add_argument("--top", type=int, default=15, help="Sitios de asignación a reportar")
+    parser.add_argument("--puerto-app", type=int, default=8081)
+    parser.add_argument("--puerto-mock", type=int, default=8091)
+    parser.add_argument("--log-app", default=os.devnull, help="Archivo para los logs de la API")
+    args = parser.parse_args()
+
+    calentamiento = args.calentamiento if args.calentamiento is not None else args.duracion * 0.1
+    mezcla = parsear_mezcla(args.mezcla)
+    tracemalloc.start(10)
+
+    directorio = tempfile.mkdtemp(prefix="soak-")
+    os.environ["API_BASE_URL"] = f"http://127.0.0.1:{args.puerto_mock}"
+    os.environ.setdefault("REGISTRO_SINIESTROS_DB", os.path.join(directorio, "registro.db"))
+    # Los gc.collect() y snapshots de la prueba bloquean el event loop: el monitor formatearía la pila
+    # en cada uno y llenaría linecache, y la captura de tráfico crecería con la carga generada
+    os.environ["MONITOR_LOOP_HABILITADO"] = "false"
+    os.environ.pop("CAPTURA_TRAFICO_ARCHIVO", None)
+
+    # La API se importa después de configurar el entorno para que los servicios apunten a la API simulada
+    import mock_upstream
+    import main as api
+
+    raiz = logging.getLogger()
+    raiz.handlers = [logging.FileHandler(args.log_app)]
+    salida = logging.getLogger("prueba_resistencia")
+    salida.addHandler(logging.StreamHandler(sys.stdout))
+    salida.propagate = False
+    salida.setLevel(logging.INFO)
+
+    mock = ServidorEnHilo(mock_upstream.crear_app(mock_upstream.latencia_exponencial(args.latencia_ms)), args.puerto_mock)
+    servidor = ServidorEnHilo(api.app, args.puerto_app)
+    mock.start()
+    servidor.start()
+    mock.esperar_inicio()
+    servidor.esperar_inicio()
+
+    carga = GeneradorCarga(f"http://127.0.0.1:{args.puerto_app}", args.rps, mezcla, args.hilos)
+    carga.iniciar()
+    inicio = time.monotonic()
+    salida.info(f"Prueba de resistencia iniciada: {args.duracion:.0f}s a {args.rps} rps, mezcla {args.mezcla}")
+
+    # Línea base y medición final se toman con carga en curso para comparar estados equivalentes;
+    # el RSS base se mide en la muestra siguiente al snapshot, que por sí mismo ocupa memoria
+    base = None
+    rss_base = None
+    ultimo = None
+    try:
+        while True:
+            transcurrido = time.monotonic() - inicio
+            if transcurrido >= args.duracion:
+                break
+            if base is None and transcurrido >= calentamiento:
+                gc.collect()
+                base = (tomar_snapshot(), carga.completadas)
+                salida.info(f"Línea base de tracemalloc tomada tras {transcurrido:.0f}s")
+            time.sleep(min(args.intervalo_muestra, max(0.1, args.duracion - transcurrido)))
+
+            gc.collect()
+            rss = rss_bytes()
+            if base is not None and rss_base is None:
+                rss_base = (rss, carga.completadas)
+            trazada, _ = tracemalloc.get_traced_memory()
+            salida.info(
+                f"[{time.monotonic() - inicio:7.0f}s] solicitudes {carga.completadas:8d} | "
+                f"RSS {rss / 1e6:7.1f} MB | trazada {trazada / 1e6:7.1f} MB | "
+                f"tareas {contar_tareas(servidor.loop):4d} | servicios {contar_servicios()}"
+            )
+
+        gc.collect()
+        rss_final = rss_bytes()
+        ultimo = (tomar_snapshot(), carga.completadas)
+    finally:
+        carga.detener()
+        servidor.detener()
+        mock.detener()
+
+    salida.info(f"Resultados: {dict(carga.resultados)}")
+    if base is None or rss_base is None:
+        salida.info("La prueba terminó antes del calentamiento; no hay línea base para comparar")
+        return 1
+
+    solicitudes = max(1, ultimo[1] - base[1])
+    solicitudes_rss = max(1, ultimo[1] - rss_base[1])
+    diferencias = ultimo[0].compare_to(base[0], "traceback")
+    crecimiento_trazado = sum(diferencia.size_diff for diferencia in diferencias)
+    crecimiento_rss = rss_final - rss_base[0]
+
+    por_categoria: Counter = Counter()
+    for diferencia in diferencias:
+        # Se clasifica por el marco más interno que pertenezca a una categoría conocida
+        archivos = [marco.filename for marco in reversed(diferencia.traceback)]
+        nombre = next((categoria(archivo) for archivo in archivos if categoria(archivo) != "otros"), "otros")
+        por_categoria[nombre] += diferencia.size_diff
+
+    salida.info(f"\nCrecimiento por categoría tras el calentamiento ({solicitudes} solicitudes):")
+    for nombre, bytes_crecidos in por_categoria.most_common():
+        salida.info(f"  {nombre:20s} {bytes_crecidos / 1024:10.1f} KiB  ({bytes_crecidos / solicitudes:8.1f} B/solicitud)")
+
+    salida.info("\nPrincipales sitios de asignación con crecimiento:")
+    for diferencia in ultimo[0].compare_to(base[0], "lineno")[:args.top]:
+        marco = diferencia.traceback[-1]
+        salida.info(f"  {diferencia.size_diff / 1024:10.1f} KiB  {diferencia.count_diff:+7d} bloques  "
+                    f"{marco.filename}:{marco.lineno}")
+
+    por_solicitud = crecimiento_trazado / solicitudes
+    rss_por_solicitud = crecimiento_rss / solicitudes_rss
+    salida.info(f"\nMemoria trazada: {por_solicitud:.1f} B/solicitud (umbral {args.umbral_bytes_solicitud:.0f})")
+    salida.info(f"RSS: {rss_por_solicitud:.1f} B/solicitud (umbral {args.umbral_rss_bytes_solicitud:.0f})")
+
+    if por_solicitud > args.umbral_bytes_solicitud or rss_por_solicitud > args.umbral_rss_bytes_solicitud:
+        salida.info("FALLO: la memoria por solicitud supera el umbral")
+        return 1
+
+    salida.info("OK: sin crecimiento de memoria por encima del umbral")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,400 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Columnas por las que se permite buscar (todas indexadas)
+CAMPOS_BUSQUEDA = ("transaccion", "num_sini", "num_pol1", "nro_documento")
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS siniestros (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    operacion TEXT NOT NULL,
+    transaccion TEXT,
+    num_sini TEXT,
+    num_pol1 TEXT,
+    nro_documento TEXT,
+    cod_cia TEXT,
+    cod_secc TEXT,
+    cod_producto TEXT,
+    datos TEXT,
+    resultado TEXT,
+    fecha TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_siniestros_transaccion ON siniestros (transaccion);
+CREATE INDEX IF NOT EXISTS idx_siniestros_num_sini ON siniestros (num_sini);
+CREATE INDEX IF NOT EXISTS idx_siniestros_num_pol1 ON siniestros (num_pol1);
+CREATE INDEX IF NOT EXISTS idx_siniestros_nro_documento ON siniestros (nro_documento);
+CREATE INDEX IF NOT EXISTS idx_siniestros_fecha ON siniestros (fecha);
+CREATE TABLE IF NOT EXISTS movimientos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    siniestro_id INTEGER NOT NULL,
+    operacion TEXT NOT NULL,
+    transaccion TEXT,
+    linea INTEGER NOT NULL,
+    num_sini TEXT,
+    num_pol1 TEXT,
+    cod_cia TEXT,
+    cod_secc TEXT,
+    cod_producto TEXT,
+    cod_cob TEXT,
+    importe_liq INTEGER,
+    total_bruto_liq INTEGER,
+    valor_movim INTEGER,
+    pendiente INTEGER NOT NULL DEFAULT 0,
+    fecha TEXT NOT NULL,
+    UNIQUE (operacion, transaccion, linea)
+);
+CREATE INDEX IF NOT EXISTS idx_movimientos_fecha ON movimientos (fecha);
+"""
+
+# Columnas de la exportación de movimientos, en orden
+COLUMNAS_EXPORTACION = (
+    "fecha", "operacion", "transaccion", "num_sini", "num_pol1", "cod_cia", "cod_secc", "cod_producto",
+    "cod_cob", "importe_liq", "total_bruto_liq", "valor_movim", "pendiente"
+)
+
+# Columnas por las que se permite agrupar el resumen
+CAMPOS_RESUMEN = ("cod_cia", "cod_secc", "cod_producto", "cod_cob")
+
+# Campos que se conservan de un request o resultado recortado por REGISTRO_SINIESTROS_MAX_BYTES_JSON
+CAMPOS_RECORTE = ("estado", "num_sini", "transaccion", "pendiente", "detalle")
+
+# Segundos entre podas de los registros más antiguos que la retención
+INTERVALO_PODA = 3600
+
+# Una operación registrada de nuevo (seguimiento pendiente que se reanuda) actualiza su movimiento
+# en lugar de duplicarlo; la fecha del movimiento sigue siendo la del envío original
+INSERTAR_MOVIMIENTO = """
+INSERT INTO movimientos (siniestro_id, operacion, transaccion, linea, num_sini, num_pol1, cod_cia, cod_secc,
+                         cod_producto, cod_cob, importe_liq, total_bruto_liq, valor_movim, pendiente, fecha)
+VALUES (:siniestro_id, :operacion, :transaccion, :linea, :num_sini, :num_pol1, :cod_cia, :cod_secc,
+        :cod_producto, :cod_cob, :importe_liq, :total_bruto_liq, :valor_movim, :pendiente, :fecha)
+ON CONFLICT (operacion, transaccion, linea) DO UPDATE SET
+    siniestro_id = excluded.siniestro_id,
+    num_sini = COALESCE(excluded.num_sini, movimientos.num_sini),
+    pendiente = excluded.pendiente
+"""
+
+
+def buscar_campo(datos: Any, campo: str) -> Optional[Any]:
+    """
+    Busca recursivamente el primer valor no vacío de un campo dentro de una respuesta de la API
+    """
+    if isinstance(datos, dict):
+        if datos.get(campo) not in (None, ""):
+            return datos[campo]
+        valores = datos.values()
+    elif isinstance(datos, list):
+        valores = datos
+    else:
+        return None
+
+    for valor in valores:
+        encontrado = buscar_campo(valor, campo)
+        if encontrado is not None:
+            return encontrado
+    return None
+
+
+def _texto(valor: Any) -> Optional[str]:
+    return None if valor is None else str(valor)
+
+
+def _entero(valor: Any) -> Optional[int]:
+    try:
+        return None if valor is None else int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def json_recortado(valor: Any, maximo: int) -> str:
+    """
+    JSON del valor; si supera maximo bytes se guarda solo un resumen con CAMPOS_RECORTE (textos de hasta 200 caracteres)
+    (las columnas indexadas y los importes ya quedan en siniestros y movimientos)
+    """
+    texto = json.dumps(valor, ensure_ascii=False, default=str)
+    tamano = len(texto.encode("utf-8"))
+    if maximo <= 0 or tamano <= maximo:
+        return texto
+    resumen: Dict[str, Any] = {"recortado": True, "bytes": tamano}
+    for campo in CAMPOS_RECORTE:
+        encontrado = buscar_campo(valor, campo)
+        if isinstance(encontrado, str):
+            resumen[campo] = encontrado[:200]
+        elif encontrado is not None and not isinstance(encontrado, (dict, list)):
+            resumen[campo] = encontrado
+    return json.dumps(resumen, ensure_ascii=False, default=str)
+
+
+def movimientos_operacion(operacion: str, datos: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Líneas con importes de una operación: una por creación, una por pago (importe_liq, total_bruto_liq)
+    y una por cada cobertura de vdatos_reserva (valor_movim)
+    """
+    if operacion == "creacion":
+        return [{"linea": 0}]
+    if operacion == "pago":
+        return [{
+            "linea": 0,
+            "cod_cob": _texto(datos.get("cod_cob")),
+            "importe_liq": _entero(datos.get("importe_liq")),
+            "total_bruto_liq": _entero(datos.get("total_bruto_liq"))
+        }]
+    if operacion == "reserva":
+        return [
+            {"linea": linea, "cod_cob": _texto(reserva.get("cod_cob")), "valor_movim": _entero(reserva.get("valor_movim"))}
+            for linea, reserva in enumerate(datos.get("vdatos_reserva") or [])
+            if isinstance(reserva, dict)
+        ]
+    return []
+
+
+class RegistroSiniestros:
+    """
+    Registro local (SQLite) de los siniestros creados, pagos y modificaciones de reserva
+    Permite consultar por póliza, documento, número de siniestro o transacción sin llamar a la API.
+    En App Engine /tmp ocupa la memoria de la instancia: los registros se conservan
+    REGISTRO_SINIESTROS_RETENCION_DIAS y el request y resultado de cada uno se recortan a
+    REGISTRO_SINIESTROS_MAX_BYTES_JSON, para que el tamaño de la base quede acotado.
+    """
+
+    def __init__(self, ruta: Optional[str] = None):
+        self.ruta = ruta or os.getenv("REGISTRO_SINIESTROS_DB", "/tmp/registro_siniestros.db")
+        self.retencion_dias = float(os.getenv("REGISTRO_SINIESTROS_RETENCION_DIAS", "30"))
+        self.max_bytes_json = int(os.getenv("REGISTRO_SINIESTROS_MAX_BYTES_JSON", "4096"))
+        self._ultima_poda = 0.0
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(self.ruta, check_same_thread=False)
+        self._conexion.row_factory = sqlite3.Row
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        existian_movimientos = self._conexion.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movimientos'"
+        ).fetchone() is not None
+        self._conexion.executescript(ESQUEMA)
+        if not existian_movimientos:
+            self._migrar_movimientos()
+        self._podar()
+        logger.info(f"Registro local de siniestros en: {self.ruta}")
+
+    def _podar(self):
+        """
+        Elimina los registros y movimientos más antiguos que la retención; SQLite reutiliza las páginas
+        liberadas, así que el archivo deja de crecer una vez alcanzada la retención
+        """
+        self._ultima_poda = time.monotonic()
+        if self.retencion_dias <= 0:
+            return
+        limite = (datetime.now() - timedelta(days=self.retencion_dias)).isoformat()
+        with self._conexion:
+            eliminados = self._conexion.execute("DELETE FROM siniestros WHERE fecha < ?", (limite,)).rowcount
+            self._conexion.execute("DELETE FROM movimientos WHERE fecha < ?", (limite,))
+        if eliminados:
+            logger.info(f"Registro local: {eliminados} registros anteriores a {limite[:10]} eliminados")
+
+    def _migrar_movimientos(self, lote: int = 1000):
+        """
+        Genera los movimientos de los registros guardados antes de que existiera la tabla
+        """
+        cursor = self._conexion.execute("SELECT * FROM siniestros ORDER BY id")
+        migrados = 0
+        with self._conexion:
+            while True:
+                filas = cursor.fetchmany(lote)
+                if not filas:
+                    break
+                for fila in filas:
+                    registro = dict(fila)
+                    try:
+                        datos = json.loads(registro["datos"]) if registro["datos"] else {}
+                        resultado = json.loads(registro["resultado"]) if registro["resultado"] else {}
+                    except ValueError:
+                        continue
+                    migrados += self._insertar_movimientos(registro["id"], registro, datos, resultado)
+        if migrados:
+            logger.info(f"Movimientos generados desde el registro existente: {migrados}")
+
+    def _insertar_movimientos(self, siniestro_id: int, registro: Dict[str, Any], datos: Dict[str, Any],
+                              resultado: Any) -> int:
+        pendiente = int(isinstance(resultado, dict) and bool(resultado.get("pendiente")))
+        movimientos = [
+            {
+                "siniestro_id": siniestro_id, "operacion": registro["operacion"], "transaccion": registro["transaccion"],
+                "num_sini": registro["num_sini"], "num_pol1": registro["num_pol1"], "cod_cia": registro["cod_cia"],
+                "cod_secc": registro["cod_secc"], "cod_producto": registro["cod_producto"], "cod_cob": None,
+                "importe_liq": None, "total_bruto_liq": None, "valor_movim": None, "pendiente": pendiente,
+                "fecha": registro["fecha"], **movimiento
+            }
+            for movimiento in movimientos_operacion(registro["operacion"], datos)
+        ]
+        self._conexion.executemany(INSERTAR_MOVIMIENTO, movimientos)
+        return len(movimientos)
+
+    def _completar_desde_historial(self, registro: Dict[str, Any]):
+        """
+        Completa póliza y documento desde registros anteriores del mismo siniestro
+        (los pagos y reservas no los reciben en el request)
+        """
+        if not registro["num_sini"] or (registro["num_pol1"] and registro["nro_documento"]):
+            return
+
+        fila = self._conexion.execute(
+            "SELECT num_pol1, nro_documento FROM siniestros "
+            "WHERE num_sini = ? AND (num_pol1 IS NOT NULL OR nro_documento IS NOT NULL) "
+            "ORDER BY id DESC LIMIT 1",
+            (registro["num_sini"],)
+        ).fetchone()
+
+        if fila:
+            registro["num_pol1"] = registro["num_pol1"] or fila["num_pol1"]
+            registro["nro_documento"] = registro["nro_documento"] or fila["nro_documento"]
+
+    def registrar(self, operacion: str, datos: Dict[str, Any], resultado: Dict[str, Any]):
+        """
+        Guarda el resultado de una operación (creacion, pago o reserva)
+        """
+        registro = {
+            "operacion": operacion,
+            "transaccion": _texto(datos.get("transaccion")),
+            "num_sini": _texto(datos.get("num_sini") or buscar_campo(resultado, "num_sini")),
+            "num_pol1": _texto(datos.get("num_pol1")),
+            "nro_documento": _texto(datos.get("nro_documento")),
+            "cod_cia": _texto(datos.get("cod_cia", datos.get("compania"))),
+            "cod_secc": _texto(datos.get("cod_secc", datos.get("seccion"))),
+            "cod_producto": _texto(datos.get("cod_producto", datos.get("producto"))),
+            "datos": json_recortado(datos, self.max_bytes_json),
+            "resultado": json_recortado(resultado, self.max_bytes_json),
+            "fecha": datetime.now().isoformat()
+        }
+
+        with self._lock:
+            self._completar_desde_historial(registro)
+            columnas = ", ".join(registro)
+            marcadores = ", ".join("?" for _ in registro)
+            with self._conexion:
+                cursor = self._conexion.execute(
+                    f"INSERT INTO siniestros ({columnas}) VALUES ({marcadores})",
+                    tuple(registro.values())
+                )
+                self._insertar_movimientos(cursor.lastrowid, registro, datos, resultado)
+            if time.monotonic() - self._ultima_poda >= INTERVALO_PODA:
+                self._podar()
+
+    async def registrar_async(self, operacion: str, datos: Dict[str, Any], resultado: Dict[str, Any]):
+        """
+        Registra fuera del event loop; un error en el registro no afecta la respuesta al cliente
+        """
+        try:
+            await asyncio.to_thread(self.registrar, operacion, datos, resultado)
+        except Exception as e:
+            logger.error(f"Error guardando {operacion} en el registro local: {str(e)}")
+
+    def buscar(self, campo: str, valor: str, limite: int = 100) -> List[Dict[str, Any]]:
+        """
+        Retorna los registros (más recientes primero) cuyo campo indexado coincide con el valor
+        """
+        if campo not in CAMPOS_BUSQUEDA:
+            raise ValueError(f"Campo de búsqueda no soportado: {campo}")
+
+        with self._lock:
+            filas = self._conexion.execute(
+                f"SELECT * FROM siniestros WHERE {campo} = ? ORDER BY id DESC LIMIT ?",
+                (valor, limite)
+            ).fetchall()
+
+        registros = []
+        for fila in filas:
+            registro = dict(fila)
+            registro["datos"] = json.loads(registro["datos"]) if registro["datos"] else None
+            registro["resultado"] = json.loads(registro["resultado"]) if registro["resultado"] else None
+            registros.append(registro)
+        return registros
+
+    async def buscar_async(self, campo: str, valor: str, limite: int = 100) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.buscar, campo, valor, limite)
+
+    def _conexion_lectura(self) -> sqlite3.Connection:
+        """
+        Conexión de solo lectura para exportaciones y resúmenes: con WAL lee en paralelo
+        a las escrituras sin tomar el lock del registro
+        """
+        conexion = sqlite3.connect(f"{Path(self.ruta).absolute().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        conexion.row_factory = sqlite3.Row
+        return conexion
+
+    def exportar(self, desde: str, hasta: str, detalle: bool = False, lote: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre los movimientos con fecha en [desde, hasta) en lotes, sin cargar el rango completo en memoria
+        Con detalle agrega el resultado de la consulta de estado guardado para cada operación
+        """
+        columnas = ", ".join(f"m.{columna}" for columna in COLUMNAS_EXPORTACION)
+        if detalle:
+            columnas += ", CASE WHEN m.linea = 0 THEN s.resultado END AS resultado"
+        conexion = self._conexion_lectura()
+        try:
+            cursor = conexion.execute(
+                f"SELECT {columnas} FROM movimientos m "
+                f"{'LEFT JOIN siniestros s ON s.id = m.siniestro_id ' if detalle else ''}"
+                "WHERE m.fecha >= ? AND m.fecha < ? ORDER BY m.fecha, m.id",
+                (desde, hasta)
+            )
+            while True:
+                filas = cursor.fetchmany(lote)
+                if not filas:
+                    break
+                for fila in filas:
+                    registro = dict(fila)
+                    if detalle and registro["resultado"]:
+                        registro["resultado"] = json.loads(registro["resultado"])
+                    yield registro
+        finally:
+            conexion.close()
+
+    def resumir(self, desde: str, hasta: str, agrupar: Sequence[str] = ("cod_cia", "cod_secc", "cod_producto"),
+                por_dia: bool = True) -> List[Dict[str, Any]]:
+        """
+        Totales de creaciones, pagos y reservas en [desde, hasta), agrupados en SQLite por día
+        y por las columnas indicadas
+        """
+        for campo in agrupar:
+            if campo not in CAMPOS_RESUMEN:
+                raise ValueError(f"Campo de agrupación no soportado: {campo}")
+        grupos = (["substr(fecha, 1, 10) AS dia"] if por_dia else []) + list(agrupar)
+        claves = (["dia"] if por_dia else []) + list(agrupar)
+        seleccion = ", ".join(grupos + [
+            "SUM(operacion = 'creacion') AS creaciones",
+            "SUM(operacion = 'pago') AS pagos",
+            "COALESCE(SUM(importe_liq), 0) AS importe_liq",
+            "COALESCE(SUM(total_bruto_liq), 0) AS total_bruto_liq",
+            "COUNT(DISTINCT CASE WHEN operacion = 'reserva' THEN transaccion END) AS reservas",
+            "COALESCE(SUM(valor_movim), 0) AS valor_movim",
+            "SUM(pendiente) AS pendientes",
+        ])
+        agrupacion = f" GROUP BY {', '.join(claves)} ORDER BY {', '.join(claves)}" if claves else ""
+
+        conexion = self._conexion_lectura()
+        try:
+            filas = conexion.execute(
+                f"SELECT {seleccion} FROM movimientos WHERE fecha >= ? AND fecha < ?{agrupacion}",
+                (desde, hasta)
+            ).fetchall()
+        finally:
+            conexion.close()
+        return [dict(fila) for fila in filas]
+
+    async def resumir_async(self, desde: str, hasta: str, agrupar: Sequence[str] = ("cod_cia", "cod_secc", "cod_producto"),
+                            por_dia: bool = True) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.resumir, desde, hasta, agrupar, por_dia)
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
@@ -0,0 +1,214 @@
+"""
+Reproducción de tráfico capturado (CAPTURA_TRAFICO_ARCHIVO) para pruebas de rendimiento realistas
+Reenvía la misma mezcla de endpoints, con los mismos tamaños de vdatos_variables / vdatos_reserva
+y los mismos tiempos entre llegadas (acelerados por --velocidad), contra la API simulada
+(mock_upstream.py) configurada con la distribución de latencias registrada para cada operación.
+Al final compara, por endpoint, los códigos de respuesta y los percentiles de duración
+de la captura con los de la reproducción.
+
+Uso:
+    python reproducir_trafico.py trafico.ndjson --velocidad 10
+    python reproducir_trafico.py trafico.ndjson --url-app http://localhost:8080 --puerto-mock 8090
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from prueba_resistencia import ServidorEnHilo, construir_solicitud
+
+# Endpoint capturado -> operación de construir_solicitud
+OPERACIONES_ENDPOINT = {
+    "/crear-siniestro": "crear",
+    "/consultar-estado": "consultar",
+    "/pago-siniestro": "pago",
+    "/modificacion-reserva": "reserva",
+}
+
+# Líneas del cuerpo multipart que no corresponden a filas del archivo (límites y encabezados de la parte)
+LINEAS_MULTIPART = 4
+
+
+def cargar_captura(ruta: str, limite: Optional[int] = None) -> List[Dict[str, Any]]:
+    registros = []
+    with open(ruta, encoding="utf-8") as archivo:
+        for linea in archivo:
+            if not linea.strip():
+                continue
+            registros.append(json.loads(linea))
+            if limite and len(registros) >= limite:
+                break
+    registros.sort(key=lambda registro: registro["t"])
+    return registros
+
+
+def latencias_por_operacion(registros: List[Dict[str, Any]]) -> Dict[str, List[float]]:
+    muestras: Dict[str, List[float]] = defaultdict(list)
+    for registro in registros:
+        for operacion, segundos, _ in registro.get("upstream", []):
+            muestras[operacion].append(segundos)
+    return dict(muestras)
+
+
+def percentiles(valores: List[float]) -> Tuple[float, float, float]:
+    if not valores:
+        return (0.0, 0.0, 0.0)
+    ordenados = sorted(valores)
+    return tuple(ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))] for p in (0.5, 0.95, 0.99))
+
+
+class Reproductor:
+    """
+    Envía cada solicitud capturada en su instante relativo dividido por la velocidad
+    """
+
+    def __init__(self, url_base: str, velocidad: float, hilos: int):
+        self.url_base = url_base
+        self.velocidad = velocidad
+        self.executor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="reproduccion")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.resultados: Dict[str, List[Tuple[Any, float]]] = defaultdict(list)
+        self.atrasadas = 0
+
+    def _sesion(self) -> Tuple[requests.Session, str]:
+        # Cada hilo simula un usuario distinto para que las cuotas por canal repartan la carga
+        sesion = getattr(self._local, "sesion", None)
+        if sesion is None:
+            sesion = self._local.sesion = requests.Session()
+            self._local.usuario = f"reproduccion{threading.get_ident() % 1000}"
+            sesion.headers.update({"X-Entidad-Colocadora": "183", "X-Sistema-Origen": "194",
+                                   "X-Usuario-Creacion": self._local.usuario})
+        return sesion, self._local.usuario
+
+    def _enviar(self, registro: Dict[str, Any], numero: int):
+        endpoint = registro["endpoint"]
+        variables = registro.get("vdatos_variables", 2)
+        reservas = registro.get("vdatos_reserva", 1)
+        sesion, usuario = self._sesion()
+        kwargs: Dict[str, Any] = {"timeout": 300}
+
+        if endpoint in OPERACIONES_ENDPOINT:
+            kwargs["json"] = construir_solicitud(OPERACIONES_ENDPOINT[endpoint], numero, variables, reservas, usuario)
+        elif endpoint == "/reserva-pago":
+            kwargs["json"] = {
+                "reserva": construir_solicitud("reserva", numero, reservas=reservas),
+                "pago": construir_solicitud("pago", numero)
+            }
+        elif endpoint == "/crear-siniestros-masivo":
+            filas = max(1, registro.get("lineas", 0) - LINEAS_MULTIPART)
+            contenido = "".join(
+                json.dumps(construir_solicitud("crear", numero * 1000 + fila, variables, usuario=usuario)) + "\n"
+                for fila in range(filas)
+            )
+            kwargs["files"] = {"archivo": ("reproduccion.ndjson", contenido, "application/x-ndjson")}
+        else:
+            return
+
+        inicio = time.monotonic()
+        try:
+            response = sesion.post(self.url_base + endpoint, **kwargs)
+            # La respuesta de la carga masiva llega en streaming: la duración incluye el cuerpo completo
+            response.content
+            estado: Any = response.status_code
+        except requests.exceptions.RequestException as e:
+            estado = type(e).__name__
+        with self._lock:
+            self.resultados[endpoint].append((estado, time.monotonic() - inicio))
+
+    def reproducir(self, registros: List[Dict[str, Any]]):
+        inicio = time.monotonic()
+        origen = registros[0]["t"] if registros else 0.0
+        for numero, registro in enumerate(registros):
+            espera = inicio + (registro["t"] - origen) / self.velocidad - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            elif espera < -1:
+                self.atrasadas += 1
+            self.executor.submit(self._enviar, registro, numero)
+        self.executor.shutdown(wait=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Reproducción de tráfico capturado contra la API simulada")
+    parser.add_argument("captura", help="Archivo NDJSON generado con CAPTURA_TRAFICO_ARCHIVO")
+    parser.add_argument("--velocidad", type=float, default=1, help="Factor de aceleración de los tiempos entre llegadas")
+    parser.add_argument("--limite", type=int, default=None, help="Máximo de solicitudes a reproducir")
+    parser.add_argument("--hilos", type=int, default=200, help="Solicitudes simultáneas máximas")
+    parser.add_argument("--url-app", default=None,
+                        help="API ya en ejecución (configurada con API_BASE_URL apuntando a la API simulada)")
+    parser.add_argument("--puerto-app", type=int, default=8081)
+    parser.add_argument("--puerto-mock", type=int, default=8091)
+    parser.add_argument("--log-app", default=os.devnull, help="Archivo para los logs de la API")
+    args = parser.parse_args()
+
+    registros = cargar_captura(args.captura, args.limite)
+    if not registros:
+        print("La captura no contiene solicitudes")
+        return 1
+    muestras = latencias_por_operacion(registros)
+
+    import mock_upstream
+    servidores = [ServidorEnHilo(mock_upstream.crear_app(mock_upstream.latencia_empirica(muestras)), args.puerto_mock)]
+
+    url_app = args.url_app
+    if url_app is None:
+        # La API se importa después de configurar el entorno para que los servicios apunten a la API simulada
+        os.environ["API_BASE_URL"] = f"http://127.0.0.1:{args.puerto_mock}"
+        os.environ.setdefault("REGISTRO_SINIESTROS_DB", os.path.join(tempfile.mkdtemp(prefix="replay-"), "registro.db"))
+        os.environ.pop("CAPTURA_TRAFICO_ARCHIVO", None)
+        import main as api
+        logging.getLogger().handlers = [logging.FileHandler(args.log_app)]
+        servidores.append(ServidorEnHilo(api.app, args.puerto_app))
+        url_app = f"http://127.0.0.1:{args.puerto_app}"
+
+    for servidor in servidores:
+        servidor.start()
+    for servidor in servidores:
+        servidor.esperar_inicio()
+
+    duracion_original = registros[-1]["t"] - registros[0]["t"]
+    print(f"Reproduciendo {len(registros)} solicitudes ({duracion_original:.0f}s capturados) a velocidad x{args.velocidad}")
+    for operacion, valores in sorted(muestras.items()):
+        p50, p95, p99 = percentiles(valores)
+        print(f"  latencia simulada {operacion:10s} n={len(valores):6d} p50={p50:.3f}s p95={p95:.3f}s p99={p99:.3f}s")
+
+    reproductor = Reproductor(url_app, args.velocidad, args.hilos)
+    inicio = time.monotonic()
+    try:
+        reproductor.reproducir(registros)
+    finally:
+        for servidor in servidores:
+            servidor.detener()
+    print(f"Reproducción completada en {time.monotonic() - inicio:.0f}s "
+          f"({reproductor.atrasadas} solicitudes enviadas con más de 1s de atraso)")
+
+    originales: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for registro in registros:
+        originales[registro["endpoint"]].append(registro)
+
+    for endpoint in sorted(originales):
+        capturadas = originales[endpoint]
+        reproducidas = reproductor.resultados.get(endpoint, [])
+        print(f"\n{endpoint}")
+        for etiqueta, estados, duraciones in (
+            ("captura", Counter(r["estado"] for r in capturadas), [r["duracion"] for r in capturadas]),
+            ("reproducción", Counter(e for e, _ in reproducidas), [d for _, d in reproducidas]),
+        ):
+            p50, p95, p99 = percentiles(duraciones)
+            print(f"  {etiqueta:13s} n={len(duraciones):6d} p50={p50:7.3f}s p95={p95:7.3f}s p99={p99:7.3f}s "
+                  f"estados={dict(estados)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import plazo_solicitud
+from drenado import drenado
+from registro_siniestros import buscar_campo
+
+logger = logging.getLogger(__name__)
+
+# Detalle del seguimiento de la reserva mientras el pago no se ha enviado: si se interrumpe,
+# el cliente debe enviar el pago por /pago-siniestro
+PAGO_NO_ENVIADO = "pago no enviado"
+
+
+def _estados(variable: str, por_defecto: str) -> frozenset:
+    return frozenset(estado.strip().upper() for estado in os.getenv(variable, por_defecto).split(",") if estado.strip())
+
+
+class ReservaPagoService:
+    """
+    Orquesta la modificación de reserva seguida del pago de un siniestro en una sola solicitud
+    Reutiliza un único token, sondea el estado de la reserva con intervalos cortos en lugar de
+    esperar 10 segundos, envía el pago en cuanto la reserva queda confirmada y hace una sola
+    consulta final de estado
+    """
+
+    def __init__(self, modificacion_reserva_service, pago_siniestro_service):
+        self.modificacion_reserva_service = modificacion_reserva_service
+        self.pago_siniestro_service = pago_siniestro_service
+        self.consulta_estado_service = modificacion_reserva_service.consulta_estado_service
+        self.intervalo_sondeo = float(os.getenv("RESERVA_PAGO_INTERVALO_SONDEO_SEGUNDOS", "1"))
+        self.espera_maxima_reserva = float(os.getenv("RESERVA_PAGO_ESPERA_MAXIMA_SEGUNDOS", "30"))
+        self.espera_estado_pago = float(os.getenv("RESERVA_PAGO_ESPERA_ESTADO_PAGO_SEGUNDOS", "2"))
+        # Solo estos estados confirman la reserva; un estado ausente o desconocido se trata como pendiente
+        self.estados_confirmados = _estados("RESERVA_PAGO_ESTADOS_CONFIRMADOS", "PROCESADO")
+        self.estados_error = _estados("RESERVA_PAGO_ESTADOS_ERROR", "ERROR,RECHAZADO,FALLIDO")
+
+    def _estado(self, resultado_api: Any) -> Optional[str]:
+        estado = buscar_campo(resultado_api, "estado")
+        return str(estado).strip().upper() if estado is not None else None
+
+    async def esperar_confirmacion_reserva(self, parametros_consulta: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Sondea el estado de la reserva hasta obtener uno de RESERVA_PAGO_ESTADOS_CONFIRMADOS
+        Lanza Exception si la reserva es rechazada o no se confirma dentro de la espera máxima, y PlazoAgotado
+        si al plazo de la solicitud solo le queda el margen para responder
+        """
+        limite = time.monotonic() + self.espera_maxima_reserva
+        intentos = 0
+
+        while True:
+            await plazo_solicitud.dormir(self.intervalo_sondeo)
+            plazo = plazo_solicitud.plazo_actual()
+            if plazo is not None and plazo.restante() <= plazo_solicitud.MARGEN_RESPUESTA_SEGUNDOS:
+                raise plazo_solicitud.PlazoAgotado(
+                    f"Plazo de la solicitud agotado esperando la confirmación de la reserva ({intentos} consultas), "
+                    f"no se envió el pago"
+                )
+            intentos += 1
+
+            try:
+                resultado = await self.consulta_estado_service.consultar_estado_siniestro(**parametros_consulta)
+            except plazo_solicitud.PlazoAgotado:
+                raise
+            except Exception as e:
+                # La transacción puede no estar registrada aún en el sistema de estados
+                logger.info(f"Reserva aún sin estado (intento {intentos}): {str(e)}")
+                resultado = None
+
+            if resultado is not None:
+                estado = self._estado(resultado)
+                if estado in self.estados_error:
+                    raise Exception(f"La modificación de reserva fue rechazada con estado {estado}: {resultado}")
+                if estado in self.estados_confirmados:
+                    logger.info(f"Reserva confirmada tras {intentos} consultas con estado: {estado}")
+                    return resultado
+                logger.info(f"Reserva aún no confirmada (intento {intentos}), estado: {estado}")
+
+            if time.monotonic() >= limite:
+                raise Exception(
+                    f"La modificación de reserva no se confirmó en {self.espera_maxima_reserva:.0f} segundos, "
+                    f"no se envió el pago"
+                )
+
+    def _resultado_parcial(self, datos_reserva: Dict[str, Any], resultado_reserva: Dict[str, Any],
+                           estado_reserva: Optional[Dict[str, Any]], datos_pago: Dict[str, Any],
+                           error: Exception, pago_intentado: bool) -> Dict[str, Any]:
+        """
+        Resultado de una reserva aplicada cuyo pago no se completó
+        Si el error ocurrió al enviar el pago, la API pudo haberlo recibido: se incluyen los parámetros
+        para verificarlo en /consultar-estado antes de reenviarlo
+        """
+        pago: Dict[str, Any] = {"transaccion": datos_pago["transaccion"], "error": str(error)}
+        if pago_intentado:
+            pago["consulta_estado"] = self.pago_siniestro_service.construir_parametros_consulta(datos_pago)
+        return {
+            "num_sini": datos_reserva["num_sini"],
+            "pago_enviado": False,
+            "reserva": {
+                "transaccion": datos_reserva["transaccion"],
+                "resultado_api": resultado_reserva,
+                "estado": estado_reserva
+            },
+            "pago": pago,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    async def procesar_reserva_pago(self, datos_reserva: Dict[str, Any], datos_pago: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Método principal que orquesta la modificación de reserva y el pago del siniestro
+        """
+        try:
+            logger.info(f"Iniciando reserva y pago para siniestro: {datos_reserva.get('num_sini')}")
+
+            # Paso 1: Obtener un único token y compartirlo entre los servicios
+            token = self.modificacion_reserva_service.token or await self.modificacion_reserva_service.obtener_token()
+            self.pago_siniestro_service.token = token
+            self.consulta_estado_service.token = token
+
+            # Paso 2: Modificar la reserva
+            # El seguimiento se registra antes del envío: si la solicitud se interrumpe con la reserva en vuelo,
+            # la API pudo recibirla y el cliente debe verificarla en lugar de repetir /reserva-pago
+            payload_reserva = self.modificacion_reserva_service.construir_payload_modificacion_reserva(datos_reserva)
+            parametros_reserva = self.modificacion_reserva_service.construir_parametros_consulta(datos_reserva)
+            drenado.registrar_seguimiento("reserva", datos_reserva, parametros_reserva, detalle=PAGO_NO_ENVIADO)
+            resultado_reserva = await self.modificacion_reserva_service.modificar_reserva_api(payload_reserva)
+
+            # Paso 3: Esperar la confirmación de la reserva con sondeo rápido
+            # Paso 4: Procesar el pago inmediatamente
+            # La reserva ya quedó aplicada: si algo falla desde aquí se retorna su resultado con el error
+            # del pago, para que el cliente no repita la solicitud completa y la aplique dos veces
+            estado_reserva = None
+            pago_intentado = False
+            parametros_pago = self.pago_siniestro_service.construir_parametros_consulta(datos_pago)
+            try:
+                estado_reserva = await self.esperar_confirmacion_reserva(parametros_reserva)
+                payload_pago = self.pago_siniestro_service.construir_payload_pago(datos_pago)
+                aplicadas = [{
+                    "operacion": "reserva",
+                    "datos": datos_reserva,
+                    "resultado": {
+                        "transaccion": datos_reserva["transaccion"],
+                        "resultado_api": resultado_reserva,
+                        "estado": estado_reserva
+                    }
+                }]
+                drenado.registrar_seguimiento("pago", datos_pago, parametros_pago, detalle="envío en curso",
+                                              aplicadas=aplicadas)
+                pago_intentado = True
+                resultado_pago = await self.pago_siniestro_service.procesar_pago_api(payload_pago)
+            except Exception as e_pago:
+                logger.error(f"Reserva aplicada pero el pago no se completó para siniestro "
+                             f"{datos_reserva.get('num_sini')}: {str(e_pago)}")
+                return self._resultado_parcial(datos_reserva, resultado_reserva, estado_reserva, datos_pago,
+                                               e_pago, pago_intentado)
+            drenado.registrar_seguimiento("pago", datos_pago, parametros_pago, detalle="reserva confirmada",
+                                          aplicadas=aplicadas)
+
+            # Paso 5: Consulta final única del estado del pago
+            await plazo_solicitud.dormir(self.espera_estado_pago)
+            try:
+                estado_pago = await self.consulta_estado_service.consultar_estado_siniestro(**parametros_pago)
+                consulta_pago = {"success": True, "resultado_api": estado_pago}
+            except Exception as e_consulta:
+                logger.warning(f"Error consultando estado después del pago: {str(e_consulta)}")
+                consulta_pago = {
+                    "success": False,
+                    "error": str(e_consulta),
+                    "message": "Pago procesado pero falló la consulta final de estado"
+                }
+
+            logger.info(f"Reserva y pago completados para siniestro: {datos_reserva.get('num_sini')}")
+
+            return {
+                "num_sini": datos_reserva["num_sini"],
+                "pago_enviado": True,
+                "reserva": {
+                    "transaccion": datos_reserva["transaccion"],
+                    "resultado_api": resultado_reserva,
+                    "estado": estado_reserva
+                },
+                "pago": {
+                    "transaccion": datos_pago["transaccion"],
+                    "resultado_api": resultado_pago,
+                    "consulta_estado": consulta_pago
+                },
+                "timestamp": datetime.now().isoformat()
+            }
+
+        except Exception as e:
+            logger.error(f"Error en proceso de reserva y pago: {str(e)}")
+            raise Exception(f"Error procesando reserva y pago: {str(e)}")
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+import time
+from functools import cached_property
+from typing import Any, Dict, Optional
+
+from carga_masiva import CargaMasivaService
+from cliente_upstream import cliente_upstream
+from consultar_estado import ConsultarEstadoService
+from crear_siniestro import CrearSiniestroService
+from modificacion_reserva import ModificacionReservaService
+from pago_siniestro import PagoSiniestroService
+from reserva_pago import ReservaPagoService
+
+logger = logging.getLogger(__name__)
+
+SERVICIOS = ("consulta_estado", "crear_siniestro", "pago_siniestro", "modificacion_reserva", "reserva_pago", "carga_masiva")
+
+
+class RegistroServicios:
+    """
+    Registro compartido de los servicios de la API
+    Cada servicio se construye la primera vez que se usa y todos comparten una única instancia
+    de ConsultarEstadoService. El calentamiento (token OAuth2 y conexiones del pool) corre al iniciar
+    la instancia y determina si está lista para recibir tráfico. El token obtenido se comparte con los
+    servicios, que solo piden uno propio si no lo tienen o la API responde 401.
+    """
+
+    def __init__(self, modelo_siniestro, registro_siniestros=None, despachador=None):
+        self.modelo_siniestro = modelo_siniestro
+        self.registro_siniestros = registro_siniestros
+        self.despachador = despachador
+        self.conexiones_calentamiento = int(os.getenv("CALENTAMIENTO_CONEXIONES", "4"))
+        self.reintento_calentamiento = float(os.getenv("CALENTAMIENTO_REINTENTO_SEGUNDOS", "5"))
+        self.espera_maxima_listo = float(os.getenv("CALENTAMIENTO_ESPERA_MAXIMA_SEGUNDOS", "20"))
+        self.listo = False
+        self.error_calentamiento: Optional[str] = None
+        self.duracion_calentamiento: Optional[float] = None
+        self.conexiones_abiertas = 0
+        self._calentado: Optional[asyncio.Event] = None
+
+    @cached_property
+    def consulta_estado(self) -> ConsultarEstadoService:
+        return ConsultarEstadoService()
+
+    @cached_property
+    def crear_siniestro(self) -> CrearSiniestroService:
+        return self._compartir_token(CrearSiniestroService())
+
+    @cached_property
+    def pago_siniestro(self) -> PagoSiniestroService:
+        return self._compartir_token(PagoSiniestroService(self.consulta_estado))
+
+    @cached_property
+    def modificacion_reserva(self) -> ModificacionReservaService:
+        return self._compartir_token(ModificacionReservaService(self.consulta_estado))
+
+    @cached_property
+    def reserva_pago(self) -> ReservaPagoService:
+        return ReservaPagoService(self.modificacion_reserva, self.pago_siniestro)
+
+    @cached_property
+    def carga_masiva(self) -> CargaMasivaService:
+        return CargaMasivaService(self.crear_siniestro, self.modelo_siniestro, self.registro_siniestros, self.despachador)
+
+    def construidos(self):
+        return [nombre for nombre in SERVICIOS if nombre in vars(self)]
+
+    def _compartir_token(self, servicio):
+        # Todos los servicios usan las mismas credenciales, así que el token de consulta_estado les sirve
+        if not servicio.token and "consulta_estado" in vars(self):
+            servicio.token = self.consulta_estado.token
+        return servicio
+
+    async def calentar(self):
+        """
+        Obtiene un token OAuth2 y abre conexiones del pool hacia la API; reintenta hasta lograrlo
+        """
+        if self._calentado is None:
+            self._calentado = asyncio.Event()
+        inicio = time.monotonic()
+        intentos = 0
+        while True:
+            intentos += 1
+            try:
+                await self.consulta_estado.obtener_token()
+                self.conexiones_abiertas = await cliente_upstream.calentar(
+                    self.consulta_estado.base_url, self.conexiones_calentamiento
+                )
+                break
+            except Exception as e:
+                self.error_calentamiento = str(e)
+                logger.warning(f"Calentamiento fallido (intento {intentos}), reintentando en "
+                               f"{self.reintento_calentamiento:.0f}s: {str(e)}")
+                await asyncio.sleep(self.reintento_calentamiento)
+
+        for nombre in ("crear_siniestro", "pago_siniestro", "modificacion_reserva"):
+            if nombre in vars(self):
+                self._compartir_token(getattr(self, nombre))
+        self.duracion_calentamiento = time.monotonic() - inicio
+        self.error_calentamiento = None
+        self.listo = True
+        self._calentado.set()
+        logger.info(f"Instancia lista en {self.duracion_calentamiento:.2f}s: token obtenido y "
+                    f"{self.conexiones_abiertas} conexiones abiertas")
+
+    async def esperar_listo(self, timeout: Optional[float] = None) -> bool:
+        """
+        Espera a que termine el calentamiento, como máximo CALENTAMIENTO_ESPERA_MAXIMA_SEGUNDOS
+        """
+        if self.listo:
+            return True
+        if self._calentado is None:
+            self._calentado = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._calentado.wait(), timeout or self.espera_maxima_listo)
+        except asyncio.TimeoutError:
+            pass
+        return self.listo
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "listo": self.listo,
+            "duracion_calentamiento_segundos": round(self.duracion_calentamiento, 3)
+            if self.duracion_calentamiento is not None else None,
+            "conexiones_abiertas": self.conexiones_abiertas,
+            "error": self.error_calentamiento,
+            "servicios_construidos": self.construidos()
+        }